@@ -0,0 +1,72 @@
+class AffixClassifier:
+    """
+    Maps a word to the ID of its unknown word class. Suffix rules are stored in a trie of reversed suffixes, so one walk
+    back from the end of the word finds its longest matching suffix. Prefix rules are checked afterwards and win over the
+    suffix match only when they are listed before it. Nothing is cached per word: the classifier belongs to a frozen
+    HMMModel, and EncodedSentences already classifies each distinct word of a test set once.
+    """
+
+    def __init__(self, affixes):
+        """
+        :param affixes: (kind, affix) rules, kind is "prefix" or "suffix". Rule c is class ID c, words matching no rule
+        get class ID len(affixes).
+        """
+        self.affixes = [tuple(rule) for rule in affixes]
+        self.no_match = len(self.affixes)
+        self.suffix_trie = {}
+        self.prefixes = []
+        for c, (kind, affix) in enumerate(self.affixes):
+            if kind == "suffix":
+                node = self.suffix_trie
+                for char in reversed(affix):
+                    node = node.setdefault(char, {})
+                # None marks the end of a suffix, a repeated suffix keeps its first rule
+                node.setdefault(None, c)
+            elif kind == "prefix":
+                self.prefixes.append((affix, c))
+            else:
+                raise ValueError("Unknown affix kind {}, expected prefix or suffix".format(kind))
+
+    def longest_suffix(self, word):
+        """
+        :param word:
+        :return: Class ID of the longest suffix rule matching the word, or self.no_match
+        """
+        node = self.suffix_trie
+        match = self.no_match
+        for char in reversed(word):
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(None, match)
+        return match
+
+    def matches(self, word):
+        """
+        :param word:
+        :return: Class IDs of every rule matching the word, in rule order
+        """
+        found = []
+        node = self.suffix_trie
+        for char in reversed(word):
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                found.append(node[None])
+        found.extend(p for prefix, p in self.prefixes if word.startswith(prefix))
+        return sorted(found)
+
+    def classify(self, word):
+        """
+        :param word:
+        :return: Unknown word class ID of the word
+        """
+        c = self.longest_suffix(word)
+        # prefixes are in rule order, only one listed before the suffix match can replace it
+        for prefix, p in self.prefixes:
+            if p >= c:
+                break
+            if word.startswith(prefix):
+                return p
+        return c
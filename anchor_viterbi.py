@@ -0,0 +1,151 @@
+from functools import partial
+
+import numpy as np
+
+from batch_viterbi import BATCH_SIZE, viterbi_decode_batch
+from hmm_counts import HMMCounts
+from decoding import decode
+from optimized_viterbi import build_model
+
+"""
+Anchor segmentation: a word that was (almost) always seen with the same tag in training, like "the" or ".", is an anchor
+and gets that tag without searching its column. The best path through an anchor's column only depends on the columns up
+to it and on the columns after it separately, so each sentence is cut at its anchors into segments that are decoded
+independently, all of the segments of the test set in length-sorted batches, then stitched back together.
+"""
+
+DOMINANCE = 1.0
+MIN_ANCHOR_COUNT = 5
+
+
+class Anchors:
+    """
+    The anchor words of a model and their tags
+    """
+
+    def __init__(self, word_tags):
+        """
+        :param word_tags: {known word ID: tag ID} of the anchor words
+        """
+        self.word_tags = word_tags
+
+    @classmethod
+    def from_counts(cls, counts, model, dominance=DOMINANCE, min_count=MIN_ANCHOR_COUNT):
+        """
+        :param counts: HMMCounts of the training data the model was trained on
+        :param model: HMMModel the anchors are used with, gives the word and tag IDs
+        :param dominance: A word is an anchor if at least this share of its occurrences have its most frequent tag
+        :param min_count: Words seen fewer times than this are never anchors
+        :return: Anchors
+        """
+        key_tags = (counts.emit_keys >> 32).astype(np.intp)
+        key_words = (counts.emit_keys & 0xFFFFFFFF).astype(np.intp)
+        word_total = np.bincount(key_words, weights=counts.emit_counts, minlength=len(counts.words))
+        best_count = np.zeros(len(counts.words))
+        np.maximum.at(best_count, key_words, counts.emit_counts)
+        # keys are sorted by tag, so the first key of a word with its top count has the lowest tag ID of the top ones
+        top = np.flatnonzero(counts.emit_counts == best_count[key_words])
+        top_words, first = np.unique(key_words[top], return_index=True)
+        best_tag = np.full(len(counts.words), -1, dtype=np.intp)
+        best_tag[top_words] = key_tags[top[first]]
+
+        word_tags = {}
+        for word, tag, count, total in zip(counts.words, best_tag.tolist(), best_count.tolist(), word_total.tolist()):
+            w = model.vocab.get(word)
+            if w is not None and total >= min_count and count >= dominance * total:
+                word_tags[w] = model.tag_ids[counts.tags[tag]]
+        return cls(word_tags)
+
+    def row_tags(self, encoded):
+        """
+        :param encoded: EncodedSentences of the test data
+        :return: Anchor tag ID of each emission row, -1 for the rows that are not anchors
+        """
+        return np.array([self.word_tags.get(key, -1) if key >= 0 else -1 for key in encoded.row_keys], dtype=np.intp)
+
+    def report(self, encoded):
+        """
+        :param encoded: EncodedSentences of the test data
+        :return: How many of the columns (not counting START) are anchors, and how many segments they cut the sentences in
+        """
+        row_tags = self.row_tags(encoded)
+        columns = sum(max(len(rows) - 1, 0) for rows in encoded.sentences)
+        anchors = sum(int((row_tags[rows[1:]] >= 0).sum()) for rows in encoded.sentences)
+        segments = len(segments_of(encoded, row_tags))
+        return "{} anchor words, {} of {} columns ({:.2f}%) skipped, {} segments to decode".format(
+            len(self.word_tags), anchors, columns, 100 * anchors / max(columns, 1), segments)
+
+
+def segments_of(encoded, row_tags):
+    """
+    :param encoded: EncodedSentences of the test data
+    :param row_tags: Anchor tag ID of each emission row (see Anchors.row_tags)
+    :return: (sentence, start, end) of every segment that needs decoding: columns start..end of the sentence, start is
+    column 0 or an anchor, end is the next anchor or the last column. Two neighbouring anchors leave nothing to decode.
+    """
+    segments = []
+    for s, rows in enumerate(encoded.sentences):
+        bounds = [0] + (np.flatnonzero(row_tags[rows[1:]] >= 0) + 1).tolist()
+        if bounds[-1] != len(rows) - 1:
+            bounds.append(len(rows) - 1)
+        segments.extend((s, start, end) for start, end in zip(bounds, bounds[1:]) if end - start > 1 or row_tags[rows[end]] < 0)
+    return segments
+
+
+def anchor_decode(model, test, encoded, batch_size, anchors):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: Number of segments decoded together, BATCH_SIZE if None
+    :param anchors: Anchors of the model
+    :return: list of sentences, each sentence is a list of (word,tag) pairs, in the same order as test
+    """
+    batch_size = batch_size or BATCH_SIZE
+    if batch_size < 1:
+        raise ValueError("batch_size must be at least 1, got {}".format(batch_size))
+    emit_matrix = encoded.emission_matrix()
+    row_tags = anchors.row_tags(encoded)
+    # an anchor's column only keeps its tag
+    anchor_rows = np.flatnonzero(row_tags >= 0)
+    masked = np.full_like(emit_matrix, float('-inf'))
+    masked[anchor_rows, row_tags[anchor_rows]] = emit_matrix[anchor_rows, row_tags[anchor_rows]]
+    masked[row_tags < 0] = emit_matrix[row_tags < 0]
+    # a segment that starts at an anchor starts from its tag alone
+    anchored = np.full_like(emit_matrix, float('-inf'))
+    anchored[anchor_rows, row_tags[anchor_rows]] = 0
+    zero_start = np.zeros(len(model.tags))
+
+    tag_ids = [np.where(row_tags[rows] >= 0, row_tags[rows], -1) for rows in encoded.sentences]
+    segments = sorted(segments_of(encoded, row_tags), key=lambda segment: segment[2] - segment[1])
+    for first in range(0, len(segments), batch_size):
+        batch = segments[first:first + batch_size]
+        lengths = np.array([end - start + 1 for _, start, end in batch])
+        emit_batch = np.zeros((len(batch), lengths.max(), len(model.tags)))
+        for b, (s, start, end) in enumerate(batch):
+            rows = encoded.sentences[s][start:end + 1]
+            emit_batch[b, :len(rows)] = masked[rows]
+            # the first column is START, or an anchor whose best path so far no longer matters
+            emit_batch[b, 0] = emit_matrix[rows[0]] + model.log_start if start == 0 else anchored[rows[0]]
+        paths = viterbi_decode_batch(zero_start, model.log_trans, emit_batch, lengths)
+        for b, (s, start, end) in enumerate(batch):
+            tag_ids[s][start + 1:end + 1] = paths[b, 1:lengths[b]]
+
+    return [list(zip(sentence, ["START"] + [model.tags[t] for t in ids[1:].tolist()])) for sentence, ids in zip(test, tag_ids)]
+
+
+def anchor_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, anchors=None, encoded=None):
+    '''
+    Tags the test data with anchor segmentation
+    train:  training data (list of sentences, with tags on the words), used if model or anchors is None
+    test, model, workers, cache, encoded: see optimized_viterbi
+    batch_size: number of segments decoded together (BATCH_SIZE if not given)
+    anchors: Anchors of the model, found in the training data with the default thresholds if not given
+    '''
+    if model is None:
+        model = build_model(train)
+    if anchors is None:
+        anchors = Anchors.from_counts(HMMCounts.from_sentences(train), model)
+    return decode(partial(anchor_viterbi, anchors=anchors), partial(anchor_decode, anchors=anchors),
+                  model, test, workers, batch_size, cache, encoded)
@@ -1,9 +1,18 @@
 # import math
-from collections import defaultdict, Counter
-from math import log
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from batch_viterbi import batch_decode
+from decoding import decode
+from hmm_counts import HMMCounts
+from hmm_model import HMMModel
+from utilities import backtrace
 
-epsilon_for_pt = 1e-5
 emit_epsilon = 1e-10   # exact setting seems to have little or no effect
+alpha = 1e-7  # smoothing constant
+UNKNOWN_AFFIXES = []  # base_viterbi has no affix classes, every unknown word is in the hapax class
 
 
 def training(sentences):
@@ -12,171 +21,189 @@ def training(sentences):
     param: sentences
     return: intitial tag probs, emission words given tag probs, transition of tags to tags probs
     """
-    init_prob = defaultdict(lambda: 0) # {init tag: #}
-    emit_prob_known = defaultdict(lambda: defaultdict(lambda: 0))  # {tag: {word: # }} for known words
-    # emit_prob_unknown = defaultdict(lambda: 0)  # {tag: # } for unknown words
-    trans_prob = defaultdict(lambda: defaultdict(lambda: 0)) # {tag0:{tag1: # }}
-    
     # Input the training set, output the formatted probabilities according to data statistics.
-    tag_count = defaultdict(int)
-    tag_pair_count = defaultdict(lambda: defaultdict(int))
-    tag_word_count = defaultdict(lambda: defaultdict(int))
-
-    for sentence in sentences:
-        prev_tag = None
-        for word, tag in sentence:
-            tag_count[tag] += 1
-            tag_pair_count[prev_tag][tag] += 1
-            tag_word_count[tag][word] += 1
-            prev_tag = tag
-
-    alpha = 1e-7  # smoothing constant
-    total_tags = len(tag_count)
-
-    # initial probabilities
-    for tag, count in tag_count.items():
-        init_prob[tag] = (count + alpha) / (len(sentences) + alpha * total_tags)
-
-    # known emission probabilities
-    for tag, words in tag_word_count.items():
-        total_words = len(words)
-        for word, count in words.items():
-            emit_prob_known[tag][word] = (tag_word_count[tag][word] + alpha) / (tag_count[tag] + alpha * (total_words + 1))
-
-    # unknown emission probabilities
-    # for tag in tag_count:
-    #     total_words = len(words)
-    #     emit_prob_unknown[tag] = alpha / (tag_count[tag] + alpha * (total_tags + 1))
-
-    # transition probabilities
-    for tag_i in tag_count:
-        for tag_j in tag_count:
-            trans_prob[tag_i][tag_j] = (tag_pair_count[tag_i][tag_j] + alpha) / (tag_count[tag_i] + alpha * total_tags)
-
-    # hapax
-    hapax_tag_probs = defaultdict(lambda: 0)
-    hapax_words = {}
-
-    for tag, words in tag_word_count.items():
-        for word, count in words.items():
-            if count == 1:
-                hapax_words[word] = tag
-    
-    hapax_tag_count = defaultdict(int)
-    hapax_total_words = 0
-    for word in hapax_words:
-        for tag in tag_count:
-            if hapax_words[word] == tag:
-                hapax_tag_count[tag] += 1
-                hapax_total_words += 1
+    return training_from_counts(HMMCounts.from_sentences(sentences))
+
+def training_from_counts(counts):
+    """
+    Computes the probabilities of training from the counts of a training set
+    param: counts: HMMCounts of the training set
+    return: intitial tag probs, emission words given tag probs, transition of tags to tags probs
+    """
+    init_prob = counts.init_probs(alpha) # {init tag: #}
+    emit_prob_known = counts.emission_probs(alpha)  # {tag: {word: # }} for known words
+    trans_prob = counts.transition_probs(alpha) # {tag0:{tag1: # }}
+
+    class_counts = count_unknown_classes(hapax_words(counts), counts)
+    hapax_tag_probs, = unknown_tag_probs(class_counts, counts)
+
+    return init_prob, emit_prob_known, trans_prob, hapax_tag_probs
+
+def hapax_words(counts, word_ids=None):
+    """
+    Finds the hapax words, a word seen once with several tags keeps the last of them
+    param: counts: HMMCounts of the training set
+    param: word_ids: only look at these word IDs (all words if None)
+    return: {word ID: tag ID}
+    """
+    single = counts.emit_counts == 1
+    if word_ids is not None:
+        single &= np.isin(counts.emit_words, word_ids)
+    return dict(zip(counts.emit_words[single].tolist(), counts.emit_tags[single].tolist()))
+
+def count_unknown_classes(hapax_words, counts, class_counts=None, sign=1):
+    """
+    Counts the tags of the hapax words, the only unknown word class of base_viterbi
+    param: hapax_words: {word ID: tag ID}
+    param: counts: HMMCounts the IDs refer to
+    param: class_counts: counts to add to (new counts if None)
+    param: sign: -1 removes the words from class_counts instead
+    return: [[Counter {tag ID: count}, number of words]]
+    """
+    if class_counts is None:
+        class_counts = [[Counter(), 0]]
+    hapax_tag_count = class_counts[0][0]
+    for t in hapax_words.values():
+        hapax_tag_count[t] += sign
+        if hapax_tag_count[t] == 0:
+            # the hapax class is smoothed over the tags it has seen
+            del hapax_tag_count[t]
+        class_counts[0][1] += sign
+    return class_counts
+
+def unknown_tag_probs(class_counts, counts):
+    """
+    param: class_counts: see count_unknown_classes
+    param: counts: HMMCounts of the training set
+    return: [hapax tag probs]
+    """
+    hapax_tag_count, hapax_total_words = class_counts[0]
     hapax_total_tags = len(hapax_tag_count)
 
-    for tag in tag_count:
-        hapax_smoothing = hapax_tag_count[tag] / hapax_total_words
+    hapax_tag_probs = {}
+    for t, tag in enumerate(counts.tags):
+        tag_count = int(counts.tag_count[t])
+        hapax_smoothing = hapax_tag_count[t] / max(hapax_total_words, 1)
         total_words = 1000
         if hapax_smoothing != 0:
-            hapax_tag_probs[tag] = (hapax_smoothing*total_words * alpha) / (tag_count[tag] + (hapax_smoothing*total_words * alpha) * (hapax_total_tags + 1))
+            hapax_tag_probs[tag] = (hapax_smoothing*total_words * alpha) / (tag_count + (hapax_smoothing*total_words * alpha) * (hapax_total_tags + 1))
         else:
-            hapax_tag_probs[tag] = alpha / (tag_count[tag] + alpha * (hapax_total_tags + 1))
-
-    # print(tag_count)
-    # print(hapax_tag_count)
-    # print(hapax_words)
-    # print(emit_prob_known)
-    # print(emit_prob_unknown)
-    # print(hapax_tag_probs)
-    # print(hapax_total_words)
-    return init_prob, emit_prob_known, trans_prob, hapax_tag_probs
+            hapax_tag_probs[tag] = alpha / (tag_count + alpha * (hapax_total_tags + 1))
+    return [hapax_tag_probs]
 
-def viterbi_stepforward(i, word, prev_prob, prev_predict_tag_seq, emit_prob_known, trans_prob, hapax_tag_probs):
+def build_model(sentences):
+    """
+    Trains on the sentences and compiles the probabilities into an HMMModel
+    param: sentences
+    return: HMMModel whose only unknown word class is the hapax class
+    """
+    return build_model_from_counts(HMMCounts.from_sentences(sentences))
+
+
+def build_model_from_counts(counts):
+    """
+    Compiles the probabilities trained from the counts into an HMMModel
+    param: counts: HMMCounts of the training sentences
+    return: HMMModel whose only unknown word class is the hapax class
+    """
+    init_prob, emit_prob_known, trans_prob, hapax_tag_probs = training_from_counts(counts)
+    return HMMModel.from_training(init_prob, emit_prob_known, trans_prob, [hapax_tag_probs], UNKNOWN_AFFIXES)
+
+def model_lists(model):
+    """
+    :param model: The HMMModel to decode against
+    :return: Its START transition log probs and transition log probs as python lists, the columns of viterbi_stepforward
+    index them per tag and list indexing is much faster than numpy's for single elements
+    """
+    return model.log_start.tolist(), model.log_trans.tolist()
+
+def viterbi_stepforward(i, log_prob_emit, prev_prob, log_start, log_trans):
     """
     Does one step of the viterbi function
     :param i: The i'th column of the lattice/MDP (0-indexing)
-    :param word: The i'th observed word
-    :param prev_prob: A dictionary of tags to probs representing the max probability of getting to each tag at in the
+    :param log_prob_emit: Log emission probabilities of the i'th observed word for every tag (see HMMModel.log_emission)
+    :param prev_prob: A list of tag IDs to log probs representing the max probability of getting to each tag at in the
     previous column of the lattice
-    :param prev_predict_tag_seq: A dictionary representing the predicted tag sequences leading up to the previous column
-    of the lattice for each tag in the previous column
-    :param emit_prob_known: Emission probabilities
-    :param trans_prob: Transition probabilities
-    :param hapax_tag_probs: Hapax probabilities
-    :return: Current best log probs leading to the i'th column for each tag, and the respective predicted tag sequences
+    :param log_start: The model's START transition log probs as a list, see model_lists
+    :param log_trans: The model's transition log probs as a list of rows, see model_lists
+    :return: Current best log probs leading to the i'th column for each tag, and the ID of the best previous tag for
+    each tag, empty for the first column
     """
-    log_prob = {} # This should store the log_prob for all the tags at current column (i)
-    predict_tag_seq = {} # This should store the tag sequence to reach each tag at column (i)
+    total_tags = len(prev_prob)
+    log_prob = [0.0] * total_tags # This should store the log_prob for all the tags at current column (i)
+    backpointer = array('H') # This should store the ID of the best previous tag for each tag at column (i)
 
     # implement one step of trellis computation at column (i)
-
     # first column has a special case
     if i == 0:
-        for tag in emit_prob_known:
-            if emit_prob_known[tag][word] == 0:
-                log_prob_emit_known = log(hapax_tag_probs[tag])
-            else:
-                log_prob_emit_known = log(emit_prob_known[tag][word])
-            log_prob_trans = log(trans_prob["START"][tag])
-            log_prob[tag] = log_prob_emit_known + log_prob_trans
-            predict_tag_seq[tag] = ["START"]
+        for tag in range(total_tags):
+            log_prob[tag] = log_prob_emit[tag] + log_start[tag]
 
     # all other columns
     else:
-        for tag in emit_prob_known:
+        for tag in range(total_tags):
             max_log_prob = float('-inf')
-            best_prev_tag = None
-            for prev_tag in emit_prob_known:
-                # CRUCIAL
-                if emit_prob_known[tag][word] == 0:
-                    log_prob_emit_known = log(hapax_tag_probs[tag])
-                else:
-                    log_prob_emit_known = log(emit_prob_known[tag][word])
-
-                log_prob_trans = log(trans_prob[prev_tag][tag])
-                prev_log_prob = prev_prob[prev_tag]
-                total_log_prob = prev_log_prob + log_prob_emit_known + log_prob_trans
+            best_prev_tag = 0
+            log_prob_emit_known = log_prob_emit[tag]
+            for prev_tag in range(total_tags):
+                total_log_prob = prev_prob[prev_tag] + log_prob_emit_known + log_trans[prev_tag][tag]
 
                 if total_log_prob > max_log_prob:
                     max_log_prob = total_log_prob
                     best_prev_tag = prev_tag
             log_prob[tag] = max_log_prob
-            predict_tag_seq[tag] = prev_predict_tag_seq[best_prev_tag] + [tag]
-    # print(emit_prob_known)
-    # print(hapax_tag_probs)
+            backpointer.append(best_prev_tag)
     
-    return log_prob, predict_tag_seq
+    return log_prob, backpointer
 
-def base_viterbi(train, test):
+def viterbi(sentence, model, emissions=None):
+    """
+    Predicts the tags of one sentence
+    :param sentence: List of observed words
+    :param model: The HMMModel to decode against
+    :param emissions: Log emission vector of each word, e.g. from EncodedSentences.emissions (looked up in the model if None)
+    :return: list of (word,tag) pairs
+    """
+    if emissions is None:
+        emissions = [model.log_emission(word) for word in sentence]
+    length = len(sentence)
+    # init log prob
+    log_prob = model.log_init.tolist()
+    log_start, log_trans = model_lists(model)
+
+    # forward steps to calculate log probs for sentence, one row of backpointers per column
+    backpointers = array('H')
+    for i in range(length):
+        log_prob, backpointer = viterbi_stepforward(i, emissions[i], log_prob, log_start, log_trans)
+        backpointers.extend(backpointer)
+
+    # according to the storage of probabilities and backpointers, get the final prediction.
+    best_tag = log_prob.index(max(log_prob))
+    best_tag_seq = backtrace(backpointers, best_tag, model.tags, length)
+    return [(word, tag) for word, tag in zip(sentence, best_tag_seq)]
+
+def viterbi_sentences(model, test, encoded, batch_size=None):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: The HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: if given, decode batches of this many sentences of similar length at once (see batch_viterbi)
+    :return: list of sentences, each sentence is a list of (word,tag) pairs
+    """
+    if batch_size:
+        return batch_decode(model, test, batch_size, encoded)
+    return [viterbi(test[sen], model, encoded.emissions(sen)) for sen in range(len(test))]
+
+def base_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, encoded=None):
     '''
     input:  training data (list of sentences, with tags on the words). E.g.,  [[(word1, tag1), (word2, tag2)], [(word3, tag3), (word4, tag4)]]
             test data (list of sentences, no tags on the words). E.g.,  [[word1, word2], [word3, word4]]
     output: list of sentences, each sentence is a list of (word,tag) pairs.
             E.g., [[(word1, tag1), (word2, tag2)], [(word3, tag3), (word4, tag4)]]
+    model:  optional HMMModel (e.g. from HMMModel.load), skips training on the training data
+    workers, batch_size, cache, encoded: see decoding.decode and viterbi_sentences
     '''
-    init_prob, emit_prob_known, trans_prob, hapax_tag_probs = training(train)
-    
-    predicts = []
-    
-    for sen in range(len(test)):
-        sentence=test[sen]
-        length = len(sentence)
-        log_prob = {}
-        predict_tag_seq = {}
-        # init log prob
-        for t in emit_prob_known:
-            if t in init_prob:
-                log_prob[t] = log(init_prob[t])
-            else:
-                log_prob[t] = log(epsilon_for_pt)
-            predict_tag_seq[t] = []
-
-        # forward steps to calculate log probs for sentence
-        for i in range(length):
-            log_prob, predict_tag_seq = viterbi_stepforward(i, sentence[i], log_prob, predict_tag_seq, emit_prob_known, trans_prob, hapax_tag_probs)
-        # print(hapax_tag_probs)
-
-        # according to the storage of probabilities and sequences, get the final prediction.
-        best_tag = max(log_prob, key=log_prob.get)
-        best_tag_seq = predict_tag_seq[best_tag]
-        predicted_tags = [(word, tag) for word, tag in zip(sentence, best_tag_seq)]
-        predicts.append(predicted_tags)
-        
-    return predicts
+    if model is None:
+        model = build_model(train)
+    return decode(base_viterbi, viterbi_sentences, model, test, workers, batch_size, cache, encoded)
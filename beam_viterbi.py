@@ -0,0 +1,102 @@
+from functools import partial
+
+import numpy as np
+
+from decoding import decode
+from optimized_viterbi import build_model
+
+"""
+Beam search decoding: after each column of the lattice only the best states are kept, the beam_width tags with the
+highest log probabilities and/or the tags within threshold of the best one, and the next column only considers
+transitions out of those. A column then costs (beam x T) instead of (T x T), at the risk of pruning the tag the best path
+goes through. Works with the model of any of the taggers, with no pruning it gives exactly their predictions.
+"""
+
+BEAM_WIDTH = 4
+
+
+def prune(log_prob, beam_width=None, threshold=None):
+    """
+    :param log_prob: Log probabilities of the tags in a column (T)
+    :param beam_width: Most tags to keep (no limit if None)
+    :param threshold: Only keep tags within this many log units of the best one (no limit if None)
+    :return: IDs of the kept tags, in increasing order
+    """
+    if beam_width is not None and beam_width < len(log_prob):
+        # ties keep the lower tag ID, like the argmax of the exact decoder
+        alive = np.argsort(-log_prob, kind="stable")[:beam_width]
+        alive.sort()
+    else:
+        alive = np.arange(len(log_prob))
+    if threshold is not None:
+        alive = alive[log_prob[alive] >= log_prob.max() - threshold]
+    return alive
+
+
+def beam_decode(log_start, log_trans, emit_vectors, beam_width=None, threshold=None):
+    """
+    Runs the viterbi lattice over one sentence, keeping only the best states of each column
+    :param log_start: START transition log vector (T)
+    :param log_trans: Transition log matrix (T x T), rows are the previous tag
+    :param emit_vectors: Log emission vector (T) for each column of the lattice, e.g. an (n x T) array
+    :param beam_width, threshold: See prune
+    :return: Tag IDs of the best path found for columns 1..n-1, the first column is always START
+    """
+    length = len(emit_vectors)
+    backpointers = np.empty((length, len(log_start)), dtype=np.intp)
+    columns = np.arange(len(log_start))
+    log_prob = emit_vectors[0] + log_start
+    for i in range(1, length):
+        alive = prune(log_prob, beam_width, threshold)
+        # same summation order as viterbi_stepforward: (prev + emit) + trans
+        scores = (log_prob[alive, None] + emit_vectors[i]) + log_trans[alive]
+        best = scores.argmax(axis=0)
+        backpointers[i] = alive[best]
+        log_prob = scores[best, columns]
+
+    best = int(log_prob.argmax())
+    path = [best]
+    for i in range(length - 1, 1, -1):
+        best = int(backpointers[i][best])
+        path.append(best)
+    path.reverse()
+    return path
+
+
+def beam_sentences(model, test, encoded, batch_size=None, beam_width=BEAM_WIDTH, threshold=None):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: not supported, see beam_viterbi
+    :param beam_width, threshold: See prune
+    :return: list of sentences, each sentence is a list of (word,tag) pairs
+    """
+    emit_matrix = encoded.emission_matrix()
+    predicts = []
+
+    for sentence, rows in zip(test, encoded.sentences):
+        path = beam_decode(model.log_start, model.log_trans, emit_matrix[rows], beam_width, threshold)
+        best_tag_seq = ["START"] + [model.tags[t] for t in path]
+        predicts.append([(word, tag) for word, tag in zip(sentence, best_tag_seq)])
+
+    return predicts
+
+
+def beam_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, beam_width=BEAM_WIDTH, threshold=None,
+                 encoded=None):
+    '''
+    Tags the test data with beam search against the model of optimized_viterbi (or any other model given)
+    train:  training data (list of sentences, with tags on the words), only used if model is None
+    test, model, workers, cache, encoded: see optimized_viterbi
+    batch_size: not supported, beam search decodes one sentence at a time
+    beam_width, threshold: how many tags to keep per column, and how far below the best one they may be (see prune)
+    '''
+    if batch_size:
+        raise ValueError("beam_viterbi decodes one sentence at a time, it cannot be used with batch_size")
+    if model is None:
+        model = build_model(train)
+    return decode(partial(beam_viterbi, beam_width=beam_width, threshold=threshold),
+                  partial(beam_sentences, beam_width=beam_width, threshold=threshold),
+                  model, test, workers, batch_size, cache, encoded)
@@ -0,0 +1,387 @@
+import argparse
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+import base_viterbi
+import optimized_viterbi
+from anchor_viterbi import Anchors, anchor_viterbi
+from batch_viterbi import batch_decode
+from checkpoint_viterbi import checkpoint_decode
+from beam_viterbi import beam_viterbi
+from forward_backward import confidence_report, sentence_posteriors, tag_confidences
+from hmm_counts import HMMCounts
+from incremental_training import IncrementalTrainer
+from kbest_viterbi import kbest_viterbi, oracle_predictions
+from online_viterbi import OnlineTagger
+from parallel_training import parallel_build_model
+from sentence_encoder import EncodedSentences
+from tag_dictionary import TagDictionary, dictionary_viterbi
+from vectorized_viterbi import viterbi_decode, vectorized_viterbi
+
+import utilities
+
+"""
+This file contains benchmarks for the taggers, run one of the commands below instead of main.py.
+"""
+
+# the modules --algorithm can name, every benchmark trains and decodes with the chosen one
+ALGORITHMS = {"base_viterbi": base_viterbi, "optimized_viterbi": optimized_viterbi}
+
+
+def sentence_peak_memory(module, train_set, test_set):
+    """
+    Measures the peak memory allocated while decoding each sentence (training is not included)
+    :param module: base_viterbi or optimized_viterbi
+    :param train_set: training data
+    :param test_set: test data, without tags
+    :return: list of (sentence length, peak bytes) pairs
+    """
+    model = module.build_model(train_set)
+    peaks = []
+    tracemalloc.start()
+    for sentence in test_set:
+        tracemalloc.reset_peak()
+        start, _ = tracemalloc.get_traced_memory()
+        module.viterbi(sentence, model)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append((len(sentence), peak - start))
+    tracemalloc.stop()
+    return peaks
+
+
+def memory(args, train_set, test_set):
+    peaks = sentence_peak_memory(args.module, train_set, utilities.strip_tags(test_set))
+
+    longest = max(peaks)
+    print("Peak memory per sentence ({} sentences):".format(len(peaks)))
+    print("\tMean: {:.1f} KiB".format(sum(peak for _, peak in peaks) / len(peaks) / 1024))
+    print("\tMax: {:.1f} KiB".format(max(peak for _, peak in peaks) / 1024))
+    print("\tLongest sentence ({} words): {:.1f} KiB".format(longest[0], longest[1] / 1024))
+
+
+def model_memory(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    test_set = utilities.strip_tags(test_set)
+
+    print("Model size: {:.1f} KiB ({} words, {} tags)".format(model.nbytes() / 1024, len(model.vocab), len(model.tags)))
+    for i in range(args.passes):
+        for sentence in test_set:
+            module.viterbi(sentence, model)
+        print("\tAfter tagging the test set {} time(s): {:.1f} KiB".format(i + 1, model.nbytes() / 1024))
+
+
+def loop_counts(sentences):
+    """
+    The per-token dictionary counting training() used before HMMCounts, kept as the reference for the training benchmark
+    """
+    tag_count = defaultdict(int)
+    tag_pair_count = defaultdict(lambda: defaultdict(int))
+    tag_word_count = defaultdict(lambda: defaultdict(int))
+
+    for sentence in sentences:
+        prev_tag = None
+        for word, tag in sentence:
+            tag_count[tag] += 1
+            tag_pair_count[prev_tag][tag] += 1
+            tag_word_count[tag][word] += 1
+            prev_tag = tag
+    return tag_count, tag_pair_count, tag_word_count
+
+
+def best_time(function, *args, repeat=3, **options):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **options)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def training(args, train_set, test_set):
+    module = args.module
+    tokens = sum(len(sentence) for sentence in train_set)
+
+    print("Training throughput ({} sentences, {} tokens, best of {}):".format(len(train_set), tokens, args.repeat))
+    for name, function in [("dictionary counts", loop_counts), ("array counts (HMMCounts)", HMMCounts.from_sentences),
+                           ("{}.training".format(args.algorithm), module.training)]:
+        seconds = best_time(function, train_set, repeat=args.repeat)
+        print("\t{}: {:.3f}s, {:,.0f} tokens/sec".format(name, seconds, tokens / seconds))
+
+
+def parallel_training(args, train_set, test_set):
+    module = args.module
+    tokens = sum(len(sentence) for sentence in train_set)
+
+    # both sides include reading and parsing the file, the workers parse their own shards
+    print("Training time from {} ({} tokens, best of {}):".format(args.training_file, tokens, args.repeat))
+    serial = best_time(lambda: module.build_model(utilities.load_dataset(args.training_file)), repeat=args.repeat)
+    print("\tserial: {:.3f}s, {:,.0f} tokens/sec".format(serial, tokens / serial))
+    for workers in args.workers:
+        seconds = best_time(parallel_build_model, module, args.training_file, workers, repeat=args.repeat)
+        print("\t{} worker(s): {:.3f}s, {:,.0f} tokens/sec, {:.2f}x serial".format(workers, seconds, tokens / seconds, serial / seconds))
+
+
+def incremental_training(args, train_set, test_set):
+    module = args.module
+    old, new = train_set[:-args.batch], train_set[-args.batch:]
+
+    print("Adding the last {} of {} training sentences (best of {}):".format(len(new), len(train_set), args.repeat))
+    full = best_time(module.build_model, train_set, repeat=args.repeat)
+    print("\tfull retrain: {:.3f}s".format(full))
+    # every repeat updates a fresh copy of the trainer, only the update is timed
+    trainers = [IncrementalTrainer(module, old) for _ in range(args.repeat)]
+    seconds = best_time(lambda: trainers.pop().update(new), repeat=args.repeat)
+    print("\tupdate(): {:.3f}s, {:.1f}x faster".format(seconds, full / seconds))
+
+
+def batch_decoding(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    test_set = utilities.strip_tags(test_set)
+    tokens = sum(len(sentence) for sentence in test_set)
+
+    print("Decoding throughput ({} sentences, {} tokens, best of {}):".format(len(test_set), tokens, args.repeat))
+    seconds = best_time(lambda: [module.viterbi(sentence, model) for sentence in test_set], repeat=args.repeat)
+    print("\tper sentence: {:.3f}s, {:,.0f} tokens/sec".format(seconds, tokens / seconds))
+    for batch_size in args.batch_sizes:
+        seconds = best_time(batch_decode, model, test_set, batch_size, repeat=args.repeat)
+        print("\tbatches of {}: {:.3f}s, {:,.0f} tokens/sec".format(batch_size, seconds, tokens / seconds))
+
+
+def beam_search(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    test_words = utilities.strip_tags(test_set)
+    tokens = sum(len(sentence) for sentence in test_set)
+
+    print("Beam search speed and accuracy ({} sentences, {} tokens, {} tags, best of {}):".format(
+        len(test_set), tokens, len(model.tags), args.repeat))
+    # no width and no threshold is the exact decoder
+    for beam_width, threshold in [(None, None)] + [(width, args.threshold) for width in args.widths]:
+        predictions = beam_viterbi(train_set, test_words, model, beam_width=beam_width, threshold=threshold)
+        seconds = best_time(beam_viterbi, train_set, test_words, model, repeat=args.repeat, beam_width=beam_width, threshold=threshold)
+        accuracy, _, _ = utilities.evaluate_accuracies(predictions, test_set)
+        multitags_acc, unseen_acc = utilities.specialword_accuracies(train_set, predictions, test_set)
+        print("\t{}: {:.3f}s, {:,.0f} tokens/sec, accuracy {:.2f}%, multitags {:.2f}%, unseen {:.2f}%".format(
+            "exact" if beam_width is None else "width {}".format(beam_width), seconds, tokens / seconds,
+            accuracy * 100, multitags_acc * 100, unseen_acc * 100))
+
+
+def tag_dictionary(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    counts = HMMCounts.from_sentences(train_set)
+    test_words = utilities.strip_tags(test_set)
+    encoded = EncodedSentences(model, test_words)
+    tokens = sum(len(sentence) for sentence in test_set)
+
+    def report(name, seconds, predictions):
+        accuracy, _, _ = utilities.evaluate_accuracies(predictions, test_set)
+        multitags_acc, unseen_acc = utilities.specialword_accuracies(train_set, predictions, test_set)
+        print("\t{}: {:.3f}s, {:,.0f} tokens/sec, accuracy {:.2f}%, multitags {:.2f}%, unseen {:.2f}%".format(
+            name, seconds, tokens / seconds, accuracy * 100, multitags_acc * 100, unseen_acc * 100))
+
+    print("Tag dictionary speed and accuracy ({} sentences, {} tokens, {} tags, best of {}):".format(
+        len(test_set), tokens, len(model.tags), args.repeat))
+    seconds = best_time(vectorized_viterbi, train_set, test_words, model, repeat=args.repeat)
+    report("exact (vectorized_viterbi)", seconds, vectorized_viterbi(train_set, test_words, model))
+    for min_count in args.min_counts:
+        for rare_count in args.rare_counts:
+            tag_dict = TagDictionary.from_counts(counts, model, min_count, rare_count)
+            seconds = best_time(dictionary_viterbi, train_set, test_words, model, repeat=args.repeat, tag_dict=tag_dict)
+            report("min count {}, rare count {}, {:.1%} of the column work".format(min_count, rare_count, tag_dict.column_work(encoded)),
+                   seconds, dictionary_viterbi(train_set, test_words, model, tag_dict=tag_dict))
+
+
+def anchor_segmentation(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    counts = HMMCounts.from_sentences(train_set)
+    test_words = utilities.strip_tags(test_set)
+    encoded = EncodedSentences(model, test_words)
+    tokens = sum(len(sentence) for sentence in test_set)
+
+    print("Anchor segmentation speed and accuracy ({} sentences, {} tokens, best of {}):".format(len(test_set), tokens, args.repeat))
+    exact = vectorized_viterbi(train_set, test_words, model)
+    seconds = best_time(vectorized_viterbi, train_set, test_words, model, repeat=args.repeat)
+    print("\tfull viterbi (vectorized_viterbi): {:.3f}s, {:,.0f} tokens/sec, accuracy {:.2f}%".format(
+        seconds, tokens / seconds, utilities.evaluate_accuracies(exact, test_set)[0] * 100))
+    for dominance in args.dominances:
+        anchors = Anchors.from_counts(counts, model, dominance, args.min_count)
+        predictions = anchor_viterbi(train_set, test_words, model, anchors=anchors)
+        seconds = best_time(anchor_viterbi, train_set, test_words, model, repeat=args.repeat, anchors=anchors)
+        changed = sum(predicted != full for sentence, full_sentence in zip(predictions, exact)
+                      for predicted, full in zip(sentence, full_sentence))
+        print("\tdominance {}: {:.3f}s, {:,.0f} tokens/sec, accuracy {:.2f}%, {} tags differ from full viterbi".format(
+            dominance, seconds, tokens / seconds, utilities.evaluate_accuracies(predictions, test_set)[0] * 100, changed))
+        print("\t\t{}".format(anchors.report(encoded)))
+
+
+def traced_peak(function, *args):
+    """
+    :return: What the function returned, and the peak memory it allocated (see sentence_peak_memory)
+    """
+    tracemalloc.start()
+    start, _ = tracemalloc.get_traced_memory()
+    result = function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak - start
+
+
+def long_documents(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    # the words of the test set, repeated until the longest document is long enough
+    words = [word for sentence in utilities.strip_tags(test_set) for word in sentence[1:-1]]
+
+    print("Decoding one long sentence, full backpointer table against checkpoints (best of {}):".format(args.repeat))
+    for size in args.sizes:
+        document = [utilities.START_TAG] + [words[i % len(words)] for i in range(size)] + [utilities.END_TAG]
+        encoded = EncodedSentences(model, [document])
+        emit_matrix, rows = encoded.emission_matrix(), encoded.sentences[0]
+
+        def full():
+            return viterbi_decode(model.log_start, model.log_trans, emit_matrix[rows])
+
+        def checkpointed():
+            return checkpoint_decode(model.log_start, model.log_trans, emit_matrix, rows)
+
+        print("\t{} tokens:".format(size))
+        for name, function in [("full", full), ("checkpoints", checkpointed)]:
+            path, peak = traced_peak(function)
+            seconds = best_time(function, repeat=args.repeat)
+            print("\t\t{}: {:.2f}s, {:,.0f} tokens/sec, peak {:.1f} KiB".format(name, seconds, size / seconds, peak / 1024))
+            if name == "full":
+                full_path = path
+            else:
+                print("\t\tsame tags: {}".format(path == full_path))
+
+
+def online_tagging(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    test_words = utilities.strip_tags(test_set)
+    offline = [module.viterbi(sentence, model) for sentence in test_words]
+
+    print("Online tagging, words pushed one at a time ({} sentences):".format(len(test_set)))
+    for max_lag in [None] + args.lags:
+        online = OnlineTagger(model, max_lag)
+        predictions = []
+        start = time.perf_counter()
+        for sentence in test_words:
+            predicted = [(utilities.START_TAG, utilities.START_TAG)]
+            for word in sentence[1:-1]:
+                predicted.extend(online.push(word))
+            predicted.extend(online.finish())
+            predictions.append(predicted)
+        seconds = time.perf_counter() - start
+        changed = sum(predicted != full for sentence, offline_sentence in zip(predictions, offline)
+                      for predicted, full in zip(sentence, offline_sentence))
+        print("\tmax lag {}: {:.2f}s, accuracy {:.2f}%, {} tags differ from offline decoding".format(
+            max_lag, seconds, utilities.evaluate_accuracies(predictions, test_set)[0] * 100, changed))
+        print("\t\t{}".format(online.stats()))
+
+
+def posteriors(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    test_words = utilities.strip_tags(test_set)
+    tokens = sum(len(sentence) for sentence in test_set)
+
+    print("Forward-backward throughput ({} sentences, {} tokens, best of {}):".format(len(test_set), tokens, args.repeat))
+    for name, function in [("viterbi (vectorized_viterbi)", lambda: vectorized_viterbi(train_set, test_words, model)),
+                           ("forward-backward", lambda: sentence_posteriors(model, test_words))]:
+        seconds = best_time(function, repeat=args.repeat)
+        print("\t{}: {:.3f}s, {:,.0f} tokens/sec".format(name, seconds, tokens / seconds))
+
+    predictions = vectorized_viterbi(train_set, test_words, model)
+    confidences = tag_confidences(model, predictions, sentence_posteriors(model, test_words))
+    print("Confidence of the viterbi tags:")
+    for threshold in args.thresholds:
+        print("\t{}".format(confidence_report(confidences, predictions, test_set, threshold)))
+
+
+def kbest_decoding(args, train_set, test_set):
+    module = args.module
+    model = module.build_model(train_set)
+    test_words = utilities.strip_tags(test_set)
+    tokens = sum(len(sentence) for sentence in test_set)
+
+    print("K-best decoding cost ({} sentences, {} tokens, best of {}):".format(len(test_set), tokens, args.repeat))
+    viterbi_seconds = best_time(vectorized_viterbi, train_set, test_words, model, repeat=args.repeat)
+    print("\tviterbi (vectorized_viterbi): {:.3f}s, {:,.0f} tokens/sec".format(viterbi_seconds, tokens / viterbi_seconds))
+    for k in args.ks:
+        seconds = best_time(kbest_viterbi, train_set, test_words, model, k, repeat=args.repeat)
+        oracle = oracle_predictions(kbest_viterbi(train_set, test_words, model, k), test_set)
+        print("\tk = {}: {:.3f}s, {:,.0f} tokens/sec, {:.2f}x viterbi, oracle accuracy {:.2f}%".format(
+            k, seconds, tokens / seconds, seconds / viterbi_seconds, utilities.evaluate_accuracies(oracle, test_set)[0] * 100))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='SHPE HMM AI Project benchmarks')
+    parser.add_argument('--train', dest='training_file', type=str, help='the file of the training data')
+    parser.add_argument('--test', dest='test_file', type=str, help='the file of the testing data')
+    parser.add_argument('--algorithm', dest='algorithm', type=str, default="optimized_viterbi", help='which algorithm to run: base_viterbi, optimized_viterbi')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('memory', help='peak memory used to decode each sentence').set_defaults(run=memory)
+    model_memory_parser = subparsers.add_parser('model-memory', help='model size before and after tagging the test set')
+    model_memory_parser.add_argument('--passes', type=int, default=3, help='how many times to tag the test set')
+    model_memory_parser.set_defaults(run=model_memory)
+    training_parser = subparsers.add_parser('training', help='training throughput in tokens/sec')
+    training_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    training_parser.set_defaults(run=training)
+    parallel_parser = subparsers.add_parser('parallel-training', help='training time with the corpus counted in worker processes')
+    parallel_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help='worker counts to time')
+    parallel_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    parallel_parser.set_defaults(run=parallel_training)
+    incremental_parser = subparsers.add_parser('incremental', help='IncrementalTrainer.update() against a full retrain')
+    incremental_parser.add_argument('--batch', type=int, default=100, help='how many new sentences to add')
+    incremental_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    incremental_parser.set_defaults(run=incremental_training)
+    batch_parser = subparsers.add_parser('batch', help='decoding throughput of the per-sentence loop and of batch_decode')
+    batch_parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16, 64, 256], help='batch sizes to time')
+    batch_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    batch_parser.set_defaults(run=batch_decoding)
+    beam_parser = subparsers.add_parser('beam', help='speed and accuracy of beam search decoding for several beam widths')
+    beam_parser.add_argument('--widths', type=int, nargs='+', default=[1, 2, 3, 4, 6, 8], help='beam widths to time')
+    beam_parser.add_argument('--threshold', type=float, help='also prune tags this many log units below the best one')
+    beam_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    beam_parser.set_defaults(run=beam_search)
+    tag_dict_parser = subparsers.add_parser('tag-dict', help='speed and accuracy of tag dictionary decoding against exact decoding')
+    tag_dict_parser.add_argument('--min-counts', type=int, nargs='+', default=[1, 2], help='tag count thresholds to time')
+    tag_dict_parser.add_argument('--rare-counts', type=int, nargs='+', default=[1, 5], help='rare word thresholds to time')
+    tag_dict_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    tag_dict_parser.set_defaults(run=tag_dictionary)
+    anchors_parser = subparsers.add_parser('anchors', help='speed and accuracy of anchor segmentation against full viterbi')
+    anchors_parser.add_argument('--dominances', type=float, nargs='+', default=[1.0, 0.99, 0.95], help='anchor dominance thresholds to time')
+    anchors_parser.add_argument('--min-count', type=int, default=5, help='words seen fewer times than this are never anchors')
+    anchors_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    anchors_parser.set_defaults(run=anchor_segmentation)
+    long_parser = subparsers.add_parser('long-documents', help='time and memory of checkpointed decoding on very long sentences')
+    long_parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000], help='document lengths in tokens')
+    long_parser.add_argument('--repeat', type=int, default=1, help='how many times to time each step')
+    long_parser.set_defaults(run=long_documents)
+    online_parser = subparsers.add_parser('online', help='delay and accuracy of online tagging for several lag limits')
+    online_parser.add_argument('--lags', type=int, nargs='+', default=[1, 2, 3, 5], help='max lags to run')
+    online_parser.set_defaults(run=online_tagging)
+    posteriors_parser = subparsers.add_parser('posteriors', help='forward-backward throughput and the accuracy of the tags by confidence')
+    posteriors_parser.add_argument('--thresholds', type=float, nargs='+', default=[0.5, 0.9, 0.99], help='confidence thresholds to report')
+    posteriors_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    posteriors_parser.set_defaults(run=posteriors)
+    kbest_parser = subparsers.add_parser('kbest', help='cost of k-best decoding against k, and the accuracy of the best of the k sequences')
+    kbest_parser.add_argument('--ks', type=int, nargs='+', default=[1, 2, 5, 10, 20], help='values of k to time')
+    kbest_parser.add_argument('--repeat', type=int, default=3, help='how many times to time each step')
+    kbest_parser.set_defaults(run=kbest_decoding)
+    args = parser.parse_args()
+
+    if args.training_file == None or args.test_file == None:
+        sys.exit('You must specify training file and testing file!')
+    if args.algorithm not in ALGORITHMS:
+        sys.exit('Unknown algorithm {}, expected one of: {}'.format(args.algorithm, ', '.join(ALGORITHMS)))
+    args.module = ALGORITHMS[args.algorithm]
+
+    args.run(args, utilities.load_dataset(args.training_file), utilities.load_dataset(args.test_file))
@@ -0,0 +1,115 @@
+from functools import partial
+from math import isqrt
+
+import numpy as np
+
+from decoding import decode
+from optimized_viterbi import build_model
+from vectorized_viterbi import viterbi_decode
+
+"""
+Checkpointed decoding for very long sentences (transcripts, OCR dumps): instead of a backpointer table with one row per
+column, the forward pass only keeps the log probabilities of every k-th column, k = sqrt(n). The traceback then goes over
+the blocks of k columns from the last one back, recomputing each block's backpointers from its checkpoint. The lattice
+takes O(sqrt(n) x T) memory instead of O(n x T), for about twice the time, and the predictions are exactly the ones of
+the other decoders, since every recomputed column is the same sum as in the forward pass.
+"""
+
+# shorter sentences have a small enough backpointer table to keep all of it
+MIN_LENGTH = 1000
+
+
+def viterbi_step(log_prob, emit_vector, log_trans, columns):
+    """
+    :param log_prob: Log probabilities of the previous column (T)
+    :param emit_vector: Log emission vector of the column (T)
+    :param log_trans: Transition log matrix (T x T), rows are the previous tag
+    :param columns: np.arange(T)
+    :return: The ID of the best previous tag for each tag, and the log probabilities of the column
+    """
+    # same summation order as viterbi_stepforward: (prev + emit) + trans
+    scores = (log_prob[:, None] + emit_vector) + log_trans
+    backpointer = scores.argmax(axis=0)
+    return backpointer, scores[backpointer, columns]
+
+
+def checkpoint_decode(log_start, log_trans, emit_matrix, rows, interval=None):
+    """
+    Runs the viterbi lattice over one sentence, keeping only every interval-th column
+    :param log_start: START transition log vector (T)
+    :param log_trans: Transition log matrix (T x T), rows are the previous tag
+    :param emit_matrix: Log emission vectors (rows x T), see EncodedSentences.emission_matrix
+    :param rows: Emission row ID of each column of the lattice
+    :param interval: Columns between checkpoints, sqrt(n) if None
+    :return: Tag IDs of the best path for columns 1..n-1, the first column is always START
+    """
+    length = len(rows)
+    if interval is None:
+        interval = max(isqrt(length), 1)
+    columns = np.arange(len(log_start))
+
+    # forward pass, checkpoint j holds column j * interval
+    checkpoints = []
+    log_prob = emit_matrix[rows[0]] + log_start
+    for i in range(1, length):
+        if (i - 1) % interval == 0:
+            checkpoints.append(log_prob)
+        log_prob = ((log_prob[:, None] + emit_matrix[rows[i]]) + log_trans).max(axis=0)
+
+    # traceback one block at a time, each block ends at the column where the following one starts
+    path = [0] * length
+    best = int(log_prob.argmax())
+    path[length - 1] = best
+    backpointers = np.empty((interval, len(log_start)), dtype=np.intp)
+    for j in range(len(checkpoints) - 1, -1, -1):
+        start = j * interval
+        end = min(start + interval, length - 1)
+        log_prob = checkpoints.pop()
+        for i in range(start + 1, end + 1):
+            backpointers[i - start - 1], log_prob = viterbi_step(log_prob, emit_matrix[rows[i]], log_trans, columns)
+        for i in range(end, start, -1):
+            best = int(backpointers[i - start - 1][best])
+            path[i - 1] = best
+    return path[1:]
+
+
+def checkpoint_sentences(model, test, encoded, batch_size=None, min_length=MIN_LENGTH):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: not supported, see checkpoint_viterbi
+    :param min_length: Sentences shorter than this are decoded with the full backpointer table (see vectorized_viterbi)
+    :return: list of sentences, each sentence is a list of (word,tag) pairs
+    """
+    # a long sentence looks its emission vectors up by row ID column by column, never gathering them into an (n x T) array
+    emit_matrix = encoded.emission_matrix()
+    predicts = []
+
+    for sentence, rows in zip(test, encoded.sentences):
+        if len(rows) < min_length:
+            path = viterbi_decode(model.log_start, model.log_trans, emit_matrix[rows])
+        else:
+            path = checkpoint_decode(model.log_start, model.log_trans, emit_matrix, rows)
+        best_tag_seq = ["START"] + [model.tags[t] for t in path]
+        predicts.append([(word, tag) for word, tag in zip(sentence, best_tag_seq)])
+
+    return predicts
+
+
+def checkpoint_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, min_length=MIN_LENGTH,
+                       encoded=None):
+    '''
+    Tags the test data with checkpointed decoding, same predictions as optimized_viterbi
+    train:  training data (list of sentences, with tags on the words), only used if model is None
+    test, model, workers, cache, encoded: see optimized_viterbi
+    batch_size: not supported, a batch would keep the full lattice of its sentences
+    min_length: sentences shorter than this are decoded with the full backpointer table (see vectorized_viterbi)
+    '''
+    if batch_size:
+        raise ValueError("checkpoint_viterbi decodes one sentence at a time, it cannot be used with batch_size")
+    if model is None:
+        model = build_model(train)
+    return decode(partial(checkpoint_viterbi, min_length=min_length), partial(checkpoint_sentences, min_length=min_length),
+                  model, test, workers, batch_size, cache, encoded)
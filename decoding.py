@@ -0,0 +1,34 @@
+from functools import partial
+
+from parallel_decoding import parallel_decode
+from sentence_encoder import EncodedSentences
+
+"""
+The steps every tagger takes once it has a model: answer what it can from the sentence cache, hand the rest to worker
+processes, or encode the test sentences and decode them here. A tagger only supplies how it decodes encoded sentences.
+"""
+
+
+def decode(tagger, decode_sentences, model, test, workers=1, batch_size=None, cache=None, encoded=None):
+    '''
+    input:  test data (list of sentences, no tags on the words). E.g.,  [[word1, word2], [word3, word4]]
+    output: list of sentences, each sentence is a list of (word,tag) pairs.
+            E.g., [[(word1, tag1), (word2, tag2)], [(word3, tag3), (word4, tag4)]]
+    tagger: the tagger function, with its own options bound (e.g. partial(beam_viterbi, beam_width=4)), called again
+            on the sentences the cache does not have, or on each chunk in the workers
+    decode_sentences: decodes the test data in this process, called as decode_sentences(model, test, encoded, batch_size)
+    model:  HMMModel to decode against
+    workers: number of worker processes to decode in, chunks of sentences are tagged in parallel
+    batch_size: passed on to the tagger, and to decode_sentences
+    cache:  optional SentenceCache, only the sentences it does not have are decoded
+    encoded: optional EncodedSentences of the test data against the model, used instead of encoding it again
+    '''
+    if cache is not None:
+        return cache.tag(test, model, partial(tagger, None, model=model, workers=workers, batch_size=batch_size))
+    if workers > 1:
+        return parallel_decode(partial(tagger, batch_size=batch_size), model, test, workers)
+
+    # every distinct word is resolved against the model once, before decoding
+    if encoded is None:
+        encoded = EncodedSentences(model, test)
+    return decode_sentences(model, test, encoded, batch_size)
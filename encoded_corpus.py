@@ -0,0 +1,100 @@
+import os
+import zipfile
+
+import numpy as np
+
+from utilities import file_digest, load_dataset, paused_gc
+
+CORPUS_VERSION = 1
+
+
+class EncodedCorpus:
+    """
+    A tagged corpus as integer arrays: the word ID and tag ID of every token (IDs in order of first occurrence) and the
+    offset of every sentence. It can be saved to a binary cache file, so that later runs load the arrays instead of
+    parsing the text again (see load_corpus).
+    """
+
+    def __init__(self, words, tags, word_seq, tag_seq, offsets):
+        """
+        :param words: List of words, a word's ID is its position in the list
+        :param tags: List of tags, a tag's ID is its position in the list
+        :param word_seq, tag_seq: Word ID and tag ID of every token
+        :param offsets: Sentence s is tokens offsets[s]:offsets[s + 1]
+        """
+        self.words = words
+        self.tags = tags
+        self.word_seq = word_seq
+        self.tag_seq = tag_seq
+        self.offsets = offsets
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        """
+        :param sentences: list of sentences, with tags on the words
+        :return: EncodedCorpus
+        """
+        tag_ids = {}
+        word_ids = {}
+        tag_seq = np.array([tag_ids.setdefault(tag, len(tag_ids)) for sentence in sentences for _, tag in sentence], dtype=np.int64)
+        word_seq = np.array([word_ids.setdefault(word, len(word_ids)) for sentence in sentences for word, _ in sentence], dtype=np.int64)
+        offsets = np.cumsum([0] + [len(sentence) for sentence in sentences], dtype=np.int64)
+        return cls(list(word_ids), list(tag_ids), word_seq, tag_seq, offsets)
+
+    def sentences(self):
+        """
+        :return: The corpus as load_dataset returns it, a list of sentences of (word, tag) pairs
+        """
+        with paused_gc():
+            pairs = list(zip(map(self.words.__getitem__, self.word_seq.tolist()), map(self.tags.__getitem__, self.tag_seq.tolist())))
+            offsets = self.offsets.tolist()
+            return [pairs[start:end] for start, end in zip(offsets, offsets[1:])]
+
+    def save(self, path):
+        """
+        :param path: File to write, in numpy .npz format
+        """
+        # words and tags never contain whitespace, so a newline separates them
+        with open(path, 'wb') as f:
+            np.savez(f, version=np.array(CORPUS_VERSION), word_seq=self.word_seq.astype(np.uint32),
+                     tag_seq=self.tag_seq.astype(np.uint16), offsets=self.offsets,
+                     words=np.frombuffer("\n".join(self.words).encode('UTF-8'), dtype=np.uint8), num_words=np.array(len(self.words)),
+                     tags=np.frombuffer("\n".join(self.tags).encode('UTF-8'), dtype=np.uint8), num_tags=np.array(len(self.tags)))
+
+    @classmethod
+    def load(cls, path):
+        """
+        :param path: File written by save
+        :return: EncodedCorpus
+        """
+        with np.load(path, allow_pickle=False) as data:
+            if data["version"] != CORPUS_VERSION:
+                raise ValueError("{} is a version {} corpus cache, expected version {}".format(path, data["version"], CORPUS_VERSION))
+            words = data["words"].tobytes().decode('UTF-8').split("\n") if data["num_words"] else []
+            tags = data["tags"].tobytes().decode('UTF-8').split("\n") if data["num_tags"] else []
+            return cls(words, tags, data["word_seq"], data["tag_seq"], data["offsets"])
+
+
+def load_corpus(data_file, cache_dir):
+    """
+    Loads a data file through the corpus cache: the first time the file is parsed and its EncodedCorpus saved in
+    cache_dir, under the hash of the file's contents, after that it is loaded from there. A changed file has a new hash,
+    so it is parsed again.
+    :param data_file: Data file, see load_dataset
+    :param cache_dir: Directory of the cache files
+    :return: EncodedCorpus of the file
+    """
+    path = os.path.join(cache_dir, "{}.corpus.npz".format(file_digest(data_file)))
+    if os.path.exists(path):
+        # an unreadable cache file (old version, truncated, missing arrays) is parsed again and rewritten
+        try:
+            return EncodedCorpus.load(path)
+        except (ValueError, KeyError, OSError, EOFError, zipfile.BadZipFile):
+            pass
+
+    corpus = EncodedCorpus.from_sentences(load_dataset(data_file))
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary name first, so another run never loads a half written file
+    corpus.save(path + ".tmp")
+    os.replace(path + ".tmp", path)
+    return corpus
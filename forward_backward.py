@@ -0,0 +1,90 @@
+import numpy as np
+
+from sentence_encoder import EncodedSentences
+from utilities import START_TAG, END_TAG
+
+"""
+Forward-backward: the posterior probability of every tag at every position of a sentence, P(tag at i | sentence), from
+the same model tables the taggers decode with. The posterior of the tag a tagger predicted is its confidence, e.g. to
+send the least certain tags to review. Each column is one vector-matrix product with the transition probabilities,
+rescaled to sum to 1 so that long sentences do not underflow: the scale is the log-sum-exp of the column in log space,
+without taking a log or an exp per column.
+"""
+
+
+def forward_backward(start, trans, emit_vectors):
+    """
+    :param start: START transition probabilities (T)
+    :param trans: Transition probability matrix (T x T), rows are the previous tag
+    :param emit_vectors: Emission probability vector (T) for each column of the lattice, an (n x T) array
+    :return: Posterior probabilities (n x T) of each tag in each column, every row sums to 1
+    """
+    length = len(emit_vectors)
+    forward = np.empty_like(emit_vectors)
+    backward = np.empty_like(emit_vectors)
+    scales = np.empty(length)  # sum of each forward column before it is rescaled
+
+    column = emit_vectors[0] * start
+    scales[0] = column.sum()
+    forward[0] = column / scales[0]
+    for i in range(1, length):
+        column = (forward[i - 1] @ trans) * emit_vectors[i]
+        scales[i] = column.sum()
+        forward[i] = column / scales[i]
+    # the backward columns use the same scales, so forward * backward is already normalized
+    backward[length - 1] = 1
+    for i in range(length - 2, -1, -1):
+        backward[i] = (trans @ (emit_vectors[i + 1] * backward[i + 1])) / scales[i + 1]
+    return forward * backward
+
+
+def sentence_posteriors(model, test, encoded=None):
+    """
+    :param model: HMMModel to compute the posteriors with
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of test, encoded here if None
+    :return: Posterior probabilities (n x T) of each sentence, tags in the order of model.tags
+    """
+    if encoded is None:
+        encoded = EncodedSentences(model, test)
+    # the model's log tables are turned into probabilities once, not per sentence
+    emit_matrix = np.exp(encoded.emission_matrix())
+    start, trans = np.exp(model.log_start), np.exp(model.log_trans)
+    return [forward_backward(start, trans, emit_matrix[rows]) for rows in encoded.sentences]
+
+
+def tag_confidences(model, predictions, posteriors):
+    """
+    :param model: HMMModel the posteriors were computed with
+    :param predictions: Predicted sentences, each a list of (word, tag) pairs
+    :param posteriors: Posteriors of the sentences, see sentence_posteriors
+    :return: For each sentence, the posterior probability of each predicted tag
+    """
+    confidences = []
+    for predicted, posterior in zip(predictions, posteriors):
+        tag_ids = [model.tag_ids[tag] for _, tag in predicted]
+        confidences.append(posterior[np.arange(len(tag_ids)), tag_ids].tolist())
+    return confidences
+
+
+def confidence_report(confidences, predictions, tag_sentences, threshold):
+    """
+    :param confidences: Posterior of each predicted tag, see tag_confidences
+    :param predictions: Predicted sentences, each a list of (word, tag) pairs
+    :param tag_sentences: The true (word, tag) pairs of the sentences
+    :param threshold: Tags with a lower posterior than this would go to review
+    :return: How many tags (not counting START and END) are below the threshold, and the accuracy below and above it
+    """
+    counts = {True: [0, 0], False: [0, 0]}  # {below threshold: [correct, total]}
+    for confidence, predicted, tagged in zip(confidences, predictions, tag_sentences):
+        for p, (_, pred_tag), (_, tag) in zip(confidence, predicted, tagged):
+            if tag in [START_TAG, END_TAG]:
+                continue
+            count = counts[p < threshold]
+            count[0] += pred_tag == tag
+            count[1] += 1
+    below, above = counts[True], counts[False]
+    total = below[1] + above[1]
+    return "{} of {} tags ({:.2f}%) below {}, accuracy {:.2f}% below and {:.2f}% above".format(
+        below[1], total, 100 * below[1] / max(total, 1), threshold,
+        100 * below[0] / max(below[1], 1), 100 * above[0] / max(above[1], 1))
@@ -0,0 +1,162 @@
+import numpy as np
+
+from encoded_corpus import EncodedCorpus
+
+
+class HMMCounts:
+    """
+    The raw counts behind training(): tag counts, tag pair counts and tag/word counts. The corpus is first encoded into
+    integer tag and word arrays (IDs in order of first occurrence, the same order the training dictionaries are built
+    in), then every count is accumulated with bulk array operations instead of one dictionary increment per token.
+
+    Tag/word counts are sparse: emit_keys holds (tag ID << 32 | word ID) for every pair that occurs, sorted, with the
+    matching counts in emit_counts.
+    """
+
+    def __init__(self, tags, words, tag_count, pair_count, emit_keys, emit_counts, num_sentences):
+        """
+        :param tags: List of tags, a tag's ID is its position in the list
+        :param words: List of words, a word's ID is its position in the list
+        :param tag_count: Count of each tag (T)
+        :param pair_count: Count of each (previous tag, tag) pair inside a sentence (T x T)
+        :param emit_keys, emit_counts: Sparse tag/word counts
+        :param num_sentences: Number of training sentences
+        """
+        self.tags = tags
+        self.words = words
+        self.tag_count = tag_count
+        self.pair_count = pair_count
+        self.emit_keys = emit_keys
+        self.emit_counts = emit_counts
+        self.num_sentences = num_sentences
+
+    @classmethod
+    def from_sentences(cls, sentences):
+        """
+        :param sentences: training data (list of sentences, with tags on the words)
+        :return: HMMCounts
+        """
+        return cls.from_corpus(EncodedCorpus.from_sentences(sentences))
+
+    @classmethod
+    def from_corpus(cls, corpus):
+        """
+        :param corpus: EncodedCorpus of the training data
+        :return: HMMCounts
+        """
+        tag_count, pair_count, emit_keys, emit_counts = count_tokens(corpus.tag_seq, corpus.word_seq, corpus.offsets,
+                                                                     len(corpus.tags))
+        return cls(list(corpus.tags), list(corpus.words), tag_count, pair_count, emit_keys, emit_counts, len(corpus.offsets) - 1)
+
+    def merge(self, other):
+        """
+        Adds the counts of a later shard of the corpus. The other shard's tag and word IDs are mapped onto this one's,
+        tags and words it sees for the first time are appended in its own order, so merging shards in corpus order gives
+        the same IDs, and the same counts, as counting the whole corpus at once.
+        :param other: HMMCounts of the sentences that follow this shard's
+        :return: The merged HMMCounts
+        """
+        tag_ids = {tag: t for t, tag in enumerate(self.tags)}
+        word_ids = {word: w for w, word in enumerate(self.words)}
+        tag_map = np.array([tag_ids.setdefault(tag, len(tag_ids)) for tag in other.tags], dtype=np.int64)
+        word_map = np.array([word_ids.setdefault(word, len(word_ids)) for word in other.words], dtype=np.int64)
+        total_tags = len(tag_ids)
+
+        tag_count = np.zeros(total_tags, dtype=self.tag_count.dtype)
+        tag_count[:len(self.tags)] = self.tag_count
+        tag_count[tag_map] += other.tag_count
+
+        pair_count = np.zeros((total_tags, total_tags), dtype=self.pair_count.dtype)
+        pair_count[:len(self.tags), :len(self.tags)] = self.pair_count
+        pair_count[np.ix_(tag_map, tag_map)] += other.pair_count
+
+        other_keys = (tag_map[other.emit_tags] << 32) | word_map[other.emit_words]
+        emit_keys, emit_counts = sum_keys([self.emit_keys, other_keys], [self.emit_counts, other.emit_counts])
+
+        return HMMCounts(list(tag_ids), list(word_ids), tag_count, pair_count, emit_keys, emit_counts,
+                         self.num_sentences + other.num_sentences)
+
+    @property
+    def emit_tags(self):
+        return self.emit_keys >> 32
+
+    @property
+    def emit_words(self):
+        return self.emit_keys & 0xffffffff
+
+    def init_probs(self, alpha):
+        """
+        :param alpha: Smoothing constant
+        :return: {tag: initial prob}
+        """
+        probs = (self.tag_count + alpha) / (self.num_sentences + alpha * len(self.tags))
+        return dict(zip(self.tags, probs.tolist()))
+
+    def emission_probs(self, alpha, tag_ids=None):
+        """
+        Laplace smoothed emission probabilities, each tag smoothed over the words seen with it
+        :param alpha: Smoothing constant
+        :param tag_ids: Only compute the rows of these tag IDs (all tags if None)
+        :return: {tag: {word: prob}} for the tag/word pairs seen in training
+        """
+        emit_tags = self.emit_tags
+        emit_words = self.emit_words
+        tag_words = np.bincount(emit_tags, minlength=len(self.tags))
+        bounds = np.searchsorted(emit_tags, np.arange(len(self.tags) + 1)).tolist()
+
+        emit_probs = {}
+        for t in range(len(self.tags)) if tag_ids is None else tag_ids:
+            start, end = bounds[t], bounds[t + 1]
+            probs = (self.emit_counts[start:end] + alpha) / (self.tag_count[t] + alpha * (tag_words[t] + 1))
+            emit_probs[self.tags[t]] = dict(zip([self.words[w] for w in emit_words[start:end].tolist()], probs.tolist()))
+        return emit_probs
+
+    def transition_probs(self, alpha, tag_ids=None):
+        """
+        Laplace smoothed transition probabilities, each previous tag smoothed over all tags
+        :param alpha: Smoothing constant
+        :param tag_ids: Only compute the rows of these previous tag IDs (all tags if None)
+        :return: {tag0: {tag1: prob}}
+        """
+        tag_ids = np.arange(len(self.tags)) if tag_ids is None else np.asarray(tag_ids, dtype=np.int64)
+        probs = (self.pair_count[tag_ids] + alpha) / (self.tag_count[tag_ids, None] + alpha * len(self.tags))
+        return {self.tags[t]: dict(zip(self.tags, row)) for t, row in zip(tag_ids.tolist(), probs.tolist())}
+
+
+def count_tokens(tag_seq, word_seq, offsets, total_tags):
+    """
+    :param tag_seq, word_seq: Tag ID and word ID of every token
+    :param offsets: Sentence s is tokens offsets[s]:offsets[s + 1]
+    :param total_tags: Number of tag IDs
+    :return: Tag counts (T), tag pair counts (T x T) and the sparse tag/word counts (emit_keys, emit_counts) of the tokens
+    """
+    tag_seq = np.asarray(tag_seq).astype(np.int64)
+    word_seq = np.asarray(word_seq).astype(np.int64)
+
+    tag_count = np.bincount(tag_seq, minlength=total_tags)
+
+    # pairs of neighbouring tokens, minus the pairs that cross from one sentence into the next
+    same_sentence = np.ones(max(len(tag_seq) - 1, 0), dtype=bool)
+    same_sentence[offsets[1:-1] - 1] = False
+    pair_keys = tag_seq[:-1][same_sentence] * total_tags + tag_seq[1:][same_sentence]
+    pair_count = np.bincount(pair_keys, minlength=total_tags * total_tags).reshape(total_tags, total_tags)
+
+    emit_keys, emit_counts = np.unique((tag_seq << 32) | word_seq, return_counts=True)
+    return tag_count, pair_count, emit_keys, emit_counts
+
+
+def sum_keys(keys, counts):
+    """
+    :param keys: List of arrays of tag/word keys, a key may be in several of them
+    :param counts: The matching lists of counts
+    :return: The sorted distinct keys, and the sum of the counts of each one
+    """
+    keys = np.concatenate(keys)
+    counts = np.concatenate(counts)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(first)
+    summed = np.add.reduceat(counts[order], starts) if len(starts) else counts
+    return keys[starts], summed
@@ -0,0 +1,326 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from math import log
+from types import MappingProxyType
+
+import numpy as np
+
+from affix_classifier import AffixClassifier
+from utilities import START_TAG
+
+epsilon_for_pt = 1e-5
+
+# model files start with MODEL_MAGIC, the format version and the length of a json header describing the arrays that follow
+MODEL_MAGIC = b"HMMPOS"
+MODEL_VERSION = 3
+MODEL_PREFIX = struct.Struct("<6sHI")
+
+
+def read_only(array):
+    array = np.asarray(array)
+    array.setflags(write=False)
+    return array
+
+
+def safe_log(prob):
+    # a tag that never occurs for an unknown word class gets a zero probability
+    return log(prob) if prob > 0 else float('-inf')
+
+
+class HMMModel:
+    """
+    A trained HMM compiled once from the output of training(). Every table is already in log space and indexed by
+    integer tag IDs (the position of the tag in self.tags), so decoding never calls log().
+
+    Known words have integer IDs (self.vocab, sorted alphabetically) and their emissions are stored as sparse CSR rows:
+    the tags word w was seen with are emit_tags[emit_indptr[w]:emit_indptr[w + 1]], with log probabilities
+    emit_log_probs[emit_indptr[w]:emit_indptr[w + 1]].
+
+    The model is frozen: its arrays are read-only and its vocabulary is a read-only mapping, so decoding (unlike
+    probing the defaultdicts returned by training()) never adds entries to it.
+    """
+
+    def __init__(self, tags, log_init, log_start, log_trans, vocab, emit_indptr, emit_tags, emit_log_probs, log_unknown,
+                 affixes=()):
+        """
+        :param tags: List of tags, a tag's ID is its position in the list
+        :param log_init: Initial log probabilities (T)
+        :param log_start: Log probabilities of the transitions out of START (T)
+        :param log_trans: Transition log probabilities (T x T), rows are the previous tag
+        :param vocab: {word: word ID} for the known words, IDs in alphabetical order
+        :param emit_indptr, emit_tags, emit_log_probs: CSR emission rows of the known words
+        :param log_unknown: Log probabilities (C x T) of each unknown word class, the last row is the plain hapax class
+        :param affixes: (kind, affix) rules for the unknown word classes, kind is "prefix" or "suffix". Rule c selects
+        log_unknown[c], see AffixClassifier for how a word's rule is picked.
+        """
+        self.tags = list(tags)
+        self.tag_ids = {tag: t for t, tag in enumerate(self.tags)}
+        self.log_init = read_only(log_init)
+        self.log_start = read_only(log_start)
+        self.log_trans = read_only(log_trans)
+        self.vocab = MappingProxyType(vocab) if isinstance(vocab, dict) else vocab
+        self.emit_indptr = read_only(emit_indptr)
+        self.emit_tags = read_only(emit_tags)
+        self.emit_log_probs = read_only(emit_log_probs)
+        self.log_unknown = read_only(log_unknown)
+        self.affixes = [tuple(rule) for rule in affixes]
+        self.classifier = AffixClassifier(self.affixes)
+
+    @classmethod
+    def from_training(cls, init_prob, emit_prob_known, trans_prob, unknown_tag_probs, affixes=()):
+        """
+        Compiles the probabilities returned by training() into log space tables
+        :param init_prob: Initial probabilities {tag: prob}
+        :param emit_prob_known: Emission probabilities {tag: {word: prob}} for known words
+        :param trans_prob: Transition probabilities {tag0: {tag1: prob}}
+        :param unknown_tag_probs: One {tag: prob} dictionary per unknown word class, the last one is the plain hapax class
+        :param affixes: See __init__
+        :return: HMMModel
+        """
+        tags = list(emit_prob_known)
+        log_init = np.array([log(init_prob[tag]) if tag in init_prob else log(epsilon_for_pt) for tag in tags])
+        # the first column of the lattice only uses the transition out of START
+        log_start = np.array([log(trans_prob[START_TAG][tag]) for tag in tags])
+        log_trans = np.array([[log(trans_prob[prev_tag][tag]) for tag in tags] for prev_tag in tags])
+        log_unknown = np.array([[safe_log(probs.get(tag, 0)) for tag in tags] for probs in unknown_tag_probs])
+
+        vocab = {word: w for w, word in enumerate(sorted(set().union(*emit_prob_known.values())))}
+        entries = sorted((vocab[word], t, log(prob)) for t, tag in enumerate(tags)
+                         for word, prob in emit_prob_known[tag].items() if prob)
+        emit_indptr = np.searchsorted([w for w, _, _ in entries], np.arange(len(vocab) + 1)).astype(np.uint32)
+        emit_tags = np.array([t for _, t, _ in entries], dtype=np.uint16)
+        emit_log_probs = np.array([log_prob for _, _, log_prob in entries], dtype=np.float64)
+
+        return cls(tags, log_init, log_start, log_trans, vocab, emit_indptr, emit_tags, emit_log_probs, log_unknown, affixes)
+
+    def unknown_class(self, word):
+        """
+        Finds which unknown word class a word falls in, the same way at every position of the sentence
+        :param word: The observed word
+        :return: Row of self.log_unknown to use for the word
+        """
+        return self.classifier.classify(word)
+
+    def emission_row(self, w):
+        """
+        :param w: ID of a known word
+        :return: The tag IDs the word was seen with, and their log emission probabilities
+        """
+        start, end = int(self.emit_indptr[w]), int(self.emit_indptr[w + 1])
+        return self.emit_tags[start:end].tolist(), self.emit_log_probs[start:end].tolist()
+
+    def log_emission(self, word):
+        """
+        Log emission probabilities of a word for every tag. Tags the word was never seen with during training use the
+        probabilities of the word's unknown class.
+        :param word: The observed word
+        :return: List of T log probabilities
+        """
+        emit = self.log_unknown[self.unknown_class(word)].tolist()
+        # a single vocabulary lookup, None means the word is unknown for every tag
+        w = self.vocab.get(word)
+        if w is not None:
+            for t, log_prob in zip(*self.emission_row(w)):
+                emit[t] = log_prob
+        return emit
+
+    def nbytes(self):
+        """
+        :return: Number of bytes held by the model's tables and vocabulary
+        """
+        arrays = [self.log_init, self.log_start, self.log_trans, self.emit_indptr, self.emit_tags, self.emit_log_probs,
+                  self.log_unknown]
+        if isinstance(self.vocab, MappedVocabulary):
+            vocab_nbytes = self.vocab.nbytes()
+        else:
+            # a copy of the vocabulary dictionary has the same size as the original, plus its keys and values
+            vocab_nbytes = sys.getsizeof(self.vocab.copy()) + sum(sys.getsizeof(word) + sys.getsizeof(w) for word, w in self.vocab.items())
+        return sum(array.nbytes for array in arrays) + vocab_nbytes
+
+    def save(self, path, training_digest="", trainer=""):
+        """
+        Writes the model to a binary file: a fixed prefix, a json header, then the raw (8 byte aligned) arrays.
+        :param path: File to write
+        :param training_digest: Hash of the training file (see utilities.file_digest), checked again by load
+        :param trainer: Name of the module whose build_model trained the model, checked again by load
+        """
+        encoded = [word.encode('UTF-8') for word in self.vocab]
+        arrays = {
+            "log_init": self.log_init,
+            "log_start": self.log_start,
+            "log_trans": self.log_trans,
+            "log_unknown": self.log_unknown,
+            "vocab_offsets": np.cumsum([0] + [len(word) for word in encoded], dtype=np.uint32),
+            "vocab_bytes": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+            "emit_indptr": self.emit_indptr,
+            "emit_tags": self.emit_tags,
+            "emit_log_probs": self.emit_log_probs,
+        }
+
+        header = {"tags": self.tags, "affixes": self.affixes, "training_digest": training_digest, "trainer": trainer,
+                  "arrays": {}}
+        # the array offsets depend on the header length, so lay them out relative to the end of the header first
+        layout = []
+        offset = 0
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            header["arrays"][name] = [offset, array.dtype.str, list(array.shape)]
+            layout.append((offset, array))
+            offset += -(-array.nbytes // 8) * 8
+        header_bytes = json.dumps(header).encode('UTF-8')
+        header_bytes += b" " * (-(MODEL_PREFIX.size + len(header_bytes)) % 8)
+        data_start = MODEL_PREFIX.size + len(header_bytes)
+
+        with open(path, 'wb') as f:
+            f.write(MODEL_PREFIX.pack(MODEL_MAGIC, MODEL_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            for offset, array in layout:
+                f.write(b"\0" * (data_start + offset - f.tell()))
+                f.write(array.tobytes())
+
+    @classmethod
+    def load(cls, path, training_digest=None, trainer=None):
+        """
+        Reads a model written by save into memory
+        :param path: File to read
+        :param training_digest: If given, the hash of the training file the model must have been trained on
+        :param trainer: If given, the name of the module that must have trained the model
+        :return: HMMModel
+        """
+        with open(path, 'rb') as f:
+            header, data_start = read_header(f, path, training_digest, trainer)
+            f.seek(0)
+            data = f.read()
+        arrays = header_arrays(data, header, data_start)
+
+        vocab_offsets = arrays["vocab_offsets"].tolist()
+        vocab_bytes = arrays["vocab_bytes"].tobytes()
+        vocab = {vocab_bytes[start:end].decode('UTF-8'): w for w, (start, end) in enumerate(zip(vocab_offsets, vocab_offsets[1:]))}
+
+        return cls(header["tags"], arrays["log_init"], arrays["log_start"], arrays["log_trans"], vocab,
+                   arrays["emit_indptr"], arrays["emit_tags"], arrays["emit_log_probs"], arrays["log_unknown"],
+                   header["affixes"])
+
+
+class MappedVocabulary:
+    """
+    The sorted vocabulary of a model file, searched in place. Looking a word up is a binary search over the UTF-8
+    bytes of the words, so nothing has to be built when the file is opened.
+    """
+
+    def __init__(self, offsets, data, data_start):
+        """
+        :param offsets: Array of V+1 byte offsets of the words in data, relative to data_start
+        :param data: The mapped file
+        :param data_start: Position of the vocabulary bytes in data
+        """
+        self.offsets = offsets
+        self.data = data
+        self.data_start = data_start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        for w in range(len(self)):
+            yield self.word_bytes(w).decode('UTF-8')
+
+    def nbytes(self):
+        return self.offsets.nbytes + int(self.offsets[-1])
+
+    def word_bytes(self, w):
+        return self.data[self.data_start + int(self.offsets[w]):self.data_start + int(self.offsets[w + 1])]
+
+    def get(self, word):
+        """
+        :param word:
+        :return: ID of the word, or None if it is not in the vocabulary
+        """
+        key = word.encode('UTF-8')
+        low, high = 0, len(self)
+        while low < high:
+            mid = (low + high) // 2
+            if self.word_bytes(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < len(self) and self.word_bytes(low) == key:
+            return low
+        return None
+
+
+class MappedHMMModel(HMMModel):
+    """
+    A read-only HMMModel whose tables are memory-mapped from a model file. Opening the file takes the same time
+    whatever the size of the vocabulary, and every process that opens the same file shares its physical pages.
+    """
+
+    @classmethod
+    def open(cls, path, training_digest=None, trainer=None):
+        """
+        Memory-maps a model written by HMMModel.save
+        :param path: File to open
+        :param training_digest: If given, the hash of the training file the model must have been trained on
+        :param trainer: If given, the name of the module that must have trained the model
+        :return: MappedHMMModel
+        """
+        with open(path, 'rb') as f:
+            header, data_start = read_header(f, path, training_digest, trainer)
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        arrays = header_arrays(data, header, data_start)
+        vocab = MappedVocabulary(arrays["vocab_offsets"], data, data_start + header["arrays"]["vocab_bytes"][0])
+
+        return cls(header["tags"], arrays["log_init"], arrays["log_start"], arrays["log_trans"], vocab,
+                   arrays["emit_indptr"], arrays["emit_tags"], arrays["emit_log_probs"], arrays["log_unknown"],
+                   header["affixes"])
+
+
+def read_header(f, path, training_digest=None, trainer=None):
+    """
+    Reads and checks the prefix and json header of a model file
+    :param f: The model file, opened in binary mode at its start
+    :param path: Name of the file, for error messages
+    :param training_digest: If given, the hash of the training file the model must have been trained on
+    :param trainer: If given, the name of the module that must have trained the model
+    :return: The header, and the position in the file where the arrays start
+    :raises ValueError: If the file is not a complete model file of this version, or fails one of the checks
+    """
+    prefix = f.read(MODEL_PREFIX.size)
+    if len(prefix) < MODEL_PREFIX.size:
+        raise ValueError("{} is not a model file".format(path))
+    magic, version, header_len = MODEL_PREFIX.unpack(prefix)
+    if magic != MODEL_MAGIC:
+        raise ValueError("{} is not a model file".format(path))
+    if version != MODEL_VERSION:
+        raise ValueError("{} has model format version {}, expected {}".format(path, version, MODEL_VERSION))
+    try:
+        header = json.loads(f.read(header_len))
+    except ValueError:
+        # a truncated header is not valid json (or not valid UTF-8)
+        raise ValueError("{} has a corrupt header".format(path))
+    data_end = MODEL_PREFIX.size + header_len + max((offset + int(np.prod(shape)) * np.dtype(dtype).itemsize
+                                                     for offset, dtype, shape in header["arrays"].values()), default=0)
+    if os.fstat(f.fileno()).st_size < data_end:
+        raise ValueError("{} is truncated".format(path))
+    if training_digest is not None and header["training_digest"] != training_digest:
+        raise ValueError("{} was trained on a different training file, retrain it with --save-model".format(path))
+    if trainer is not None and header["trainer"] != trainer:
+        raise ValueError("{} was trained by {}, not {}, retrain it with --save-model".format(path, header["trainer"], trainer))
+    return header, MODEL_PREFIX.size + header_len
+
+
+def header_arrays(data, header, data_start):
+    """
+    :param data: Contents of the model file (bytes or a mmap), the arrays are views into it
+    :param header: The header returned by read_header
+    :param data_start: Position of the arrays in data
+    :return: {array name: numpy array}
+    """
+    arrays = {}
+    for name, (offset, dtype, shape) in header["arrays"].items():
+        count = int(np.prod(shape))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=data_start + offset).reshape(shape)
+    return arrays
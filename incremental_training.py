@@ -0,0 +1,82 @@
+import numpy as np
+
+from hmm_counts import HMMCounts
+from hmm_model import HMMModel
+
+
+class IncrementalTrainer:
+    """
+    Trains a model that can be updated with new tagged sentences without retraining on the whole corpus. The trainer
+    keeps the raw counts (HMMCounts), the hapax words and the tag counts of the unknown word classes next to the
+    probabilities trained from them.
+
+    update() only counts the new sentences and merges them in. Then it recomputes the emission and transition rows of
+    the tags whose counts changed, re-checks hapax membership for the words whose counts changed, and moves those words
+    between the unknown word classes. The probabilities, and the model compiled from them, are exactly the ones a full
+    retrain on all of the sentences gives.
+    """
+
+    def __init__(self, module, sentences):
+        """
+        :param module: base_viterbi or optimized_viterbi, the algorithm whose model is trained
+        :param sentences: training data (list of sentences, with tags on the words)
+        """
+        self.module = module
+        self.counts = HMMCounts.from_sentences(sentences)
+        self.retrain()
+
+    def retrain(self):
+        """
+        Recomputes every probability from the counts
+        """
+        module, counts = self.module, self.counts
+        self.init_prob = counts.init_probs(module.alpha)
+        self.emit_prob_known = counts.emission_probs(module.alpha)
+        self.trans_prob = counts.transition_probs(module.alpha)
+        self.hapax_words = module.hapax_words(counts)
+        self.class_counts = module.count_unknown_classes(self.hapax_words, counts)
+        self.unknown_tag_probs = module.unknown_tag_probs(self.class_counts, counts)
+        self.model = self.compile()
+
+    def update(self, sentences):
+        """
+        Adds new training sentences
+        :param sentences: training data (list of sentences, with tags on the words)
+        :return: The updated HMMModel
+        """
+        module, old = self.module, self.counts
+        self.counts = counts = old.merge(HMMCounts.from_sentences(sentences))
+        if len(counts.tags) != len(old.tags):
+            # a new tag changes the smoothing denominator of every table
+            self.retrain()
+            return self.model
+
+        # every initial probability depends on the number of sentences, the other tables only change for the tags and
+        # words whose counts changed
+        self.init_prob = counts.init_probs(module.alpha)
+        tag_ids = np.flatnonzero(counts.tag_count != old.tag_count).tolist()
+        self.emit_prob_known.update(counts.emission_probs(module.alpha, tag_ids))
+        self.trans_prob.update(counts.transition_probs(module.alpha, tag_ids))
+
+        # the merged tag/word keys are a superset of the old ones
+        old_emit_counts = np.zeros_like(counts.emit_counts)
+        old_emit_counts[np.searchsorted(counts.emit_keys, old.emit_keys)] = old.emit_counts
+        word_ids = np.unique(counts.emit_words[counts.emit_counts != old_emit_counts])
+
+        # only those words can join or leave the hapax words
+        old_hapax = {w: self.hapax_words.pop(w) for w in word_ids.tolist() if w in self.hapax_words}
+        new_hapax = module.hapax_words(counts, word_ids)
+        module.count_unknown_classes(old_hapax, counts, self.class_counts, sign=-1)
+        module.count_unknown_classes(new_hapax, counts, self.class_counts)
+        self.hapax_words.update(new_hapax)
+        self.unknown_tag_probs = module.unknown_tag_probs(self.class_counts, counts)
+
+        self.model = self.compile()
+        return self.model
+
+    def compile(self):
+        """
+        :return: HMMModel of the current probabilities
+        """
+        return HMMModel.from_training(self.init_prob, self.emit_prob_known, self.trans_prob, self.unknown_tag_probs,
+                                      self.module.UNKNOWN_AFFIXES)
@@ -0,0 +1,99 @@
+import numpy as np
+
+from optimized_viterbi import build_model
+from sentence_encoder import EncodedSentences
+
+"""
+K-best decoding: the k highest-scoring tag sequences of a sentence from a single pass over the lattice. Each state keeps
+the k best partial paths into it as a (T x k) array of scores, with the previous tag and the rank of the path there for
+each of them, instead of a single best one. A column extends the T x k paths of the previous column to every tag and
+keeps the k best per tag; the k best sequences are then followed back from the k best final (tag, rank) pairs. With
+k = 1 it is the viterbi decoder.
+"""
+
+K = 5
+
+
+def kbest_decode(log_start, log_trans, emit_vectors, k=K):
+    """
+    Runs the viterbi lattice over one sentence, keeping the k best paths into each state
+    :param log_start: START transition log vector (T)
+    :param log_trans: Transition log matrix (T x T), rows are the previous tag
+    :param emit_vectors: Log emission vector (T) for each column of the lattice, e.g. an (n x T) array
+    :param k: Number of sequences
+    :return: Up to k (log probability, tag IDs for columns 1..n-1) pairs, best first. There are fewer when the sentence
+    has fewer than k possible tag sequences.
+    """
+    length, total_tags = len(emit_vectors), len(log_start)
+    if length == 1:
+        return [(float((emit_vectors[0] + log_start).max()), [])]
+    back_tags = np.zeros((length, total_tags, k), dtype=np.intp)
+    back_ranks = np.zeros((length, total_tags, k), dtype=np.intp)
+    # the tag of the first column is never part of a sequence (it is START), so only its best one counts for each tag
+    # of the second column, as in the other decoders
+    log_prob = emit_vectors[0] + log_start
+    first = (log_prob[:, None] + emit_vectors[1]) + log_trans
+    scores = np.full((total_tags, k), float('-inf'))
+    back_tags[1, :, 0] = first.argmax(axis=0)
+    scores[:, 0] = first[back_tags[1, :, 0], np.arange(total_tags)]
+    for i in range(2, length):
+        # row p * k + r: the rank r path into tag p, extended to each tag. Same summation order as
+        # viterbi_stepforward: (prev + emit) + trans
+        candidates = ((scores[:, :, None] + emit_vectors[i]) + log_trans[:, None, :]).reshape(total_tags * k, total_tags)
+        # a stable sort keeps the lowest previous tag first among equal scores, like the argmax of the other decoders
+        best = np.argsort(-candidates, axis=0, kind="stable")[:k]
+        scores = np.take_along_axis(candidates, best, axis=0).T
+        back_tags[i] = (best // k).T
+        back_ranks[i] = (best % k).T
+
+    sequences = []
+    final = scores.reshape(-1)
+    for index in np.argsort(-final, kind="stable")[:k].tolist():
+        if final[index] == float('-inf'):
+            break
+        tag, rank = divmod(index, k)
+        path = [tag]
+        for i in range(length - 1, 1, -1):
+            tag, rank = int(back_tags[i, tag, rank]), int(back_ranks[i, tag, rank])
+            path.append(tag)
+        path.reverse()
+        sequences.append((float(final[index]), path))
+    return sequences
+
+
+def kbest_viterbi(train, test, model=None, k=K, encoded=None):
+    '''
+    input:  training data (list of sentences, with tags on the words). E.g.,  [[(word1, tag1), (word2, tag2)], [(word3, tag3), (word4, tag4)]]
+            test data (list of sentences, no tags on the words). E.g.,  [[word1, word2], [word3, word4]]
+    output: for each sentence, its k best tag sequences as (log probability, list of (word,tag) pairs), best first.
+            E.g., [[(-40.2, [(word1, tag1), (word2, tag2)]), (-41.7, [(word1, tag3), (word2, tag2)])]]
+    model:  optional HMMModel (e.g. from HMMModel.load), skips training on the training data
+    k:      number of sequences per sentence
+    encoded: optional EncodedSentences of the test data against the model, used instead of encoding it again
+    '''
+    if model is None:
+        model = build_model(train)
+
+    # every distinct word is resolved against the model once, before decoding
+    if encoded is None:
+        encoded = EncodedSentences(model, test)
+    emit_matrix = encoded.emission_matrix()
+    predicts = []
+
+    for sentence, rows in zip(test, encoded.sentences):
+        sequences = kbest_decode(model.log_start, model.log_trans, emit_matrix[rows], k)
+        predicts.append([(log_prob, list(zip(sentence, ["START"] + [model.tags[t] for t in path])))
+                         for log_prob, path in sequences])
+
+    return predicts
+
+
+def oracle_predictions(kbest, tag_sentences):
+    """
+    :param kbest: What kbest_viterbi returns
+    :param tag_sentences: The true (word, tag) pairs of the sentences
+    :return: For each sentence, the one of its k sequences with the most correct tags, e.g. to measure how much a later
+    step choosing among the k sequences could gain
+    """
+    return [max((predicted for _, predicted in sequences), key=lambda predicted: sum(p == t for p, t in zip(predicted, tagged)))
+            for sequences, tagged in zip(kbest, tag_sentences)]
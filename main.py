@@ -1,8 +1,26 @@
 import argparse
 import sys
+import time
+from functools import partial
+from itertools import tee
 
-from base_viterbi import base_viterbi
-from optimized_viterbi import optimized_viterbi
+import base_viterbi
+import beam_viterbi
+import checkpoint_viterbi
+import optimized_viterbi
+import vectorized_viterbi
+from anchor_viterbi import Anchors, anchor_viterbi
+from encoded_corpus import load_corpus
+from forward_backward import confidence_report, sentence_posteriors, tag_confidences
+from hmm_counts import HMMCounts
+from kbest_viterbi import kbest_viterbi, oracle_predictions
+from hmm_model import MappedHMMModel
+from online_viterbi import online_viterbi
+from parallel_training import parallel_build_model
+from sentence_cache import SentenceCache
+from sentence_encoder import EncodedSentences
+from streaming import stream_counts, stream_tag
+from tag_dictionary import TagDictionary, dictionary_viterbi
 
 import utilities
 
@@ -12,26 +30,136 @@ This file contains the main application that is run.
 
 
 def main(args):
-    print("Loading dataset...")
-    train_set = utilities.load_dataset(args.training_file)
-    test_set = utilities.load_dataset(args.test_file)
-    print("Loaded dataset")
-    print()
+    # each algorithm and the module whose build_model trains the model it decodes against
+    algorithms = {"base_viterbi": (base_viterbi.base_viterbi, base_viterbi),
+                  "optimized_viterbi": (optimized_viterbi.optimized_viterbi, optimized_viterbi),
+                  "vectorized_viterbi": (vectorized_viterbi.vectorized_viterbi, optimized_viterbi)}
+    algorithm, trainer = algorithms[args.algorithm]
+    name = args.algorithm
+    if args.beam_width != None or args.beam_threshold != None:
+        # beam search decodes against the model of the chosen algorithm
+        algorithm = partial(beam_viterbi.beam_viterbi, beam_width=args.beam_width, threshold=args.beam_threshold)
+        name = "{} (beam width {}, threshold {})".format(args.algorithm, args.beam_width, args.beam_threshold)
+
+    train_set = None
+    train_corpus = None
+    if args.corpus_cache != None:
+        print("Loading dataset (cache: {})...".format(args.corpus_cache))
+        train_corpus = load_corpus(args.training_file, args.corpus_cache)
+        train_set = train_corpus.sentences()
+        test_set = load_corpus(args.test_file, args.corpus_cache).sentences()
+        print("Loaded dataset")
+        print()
+    elif not args.stream:
+        print("Loading dataset...")
+        train_set = utilities.load_dataset(args.training_file)
+        test_set = utilities.load_dataset(args.test_file)
+        print("Loaded dataset")
+        print()
+
+    if args.model_file != None:
+        print("Loading model {}...".format(args.model_file))
+        try:
+            model = MappedHMMModel.open(args.model_file, utilities.file_digest(args.training_file), trainer.__name__)
+        except ValueError as e:
+            sys.exit(str(e))
+        except OSError as e:
+            sys.exit("Cannot read {}: {}".format(e.filename, e.strerror))
+    else:
+        print("Training model...")
+        if args.train_workers > 1:
+            model = parallel_build_model(trainer, args.training_file, args.train_workers)
+        elif train_corpus != None:
+            model = trainer.build_model_from_counts(HMMCounts.from_corpus(train_corpus))
+        elif args.stream:
+            model = trainer.build_model_from_counts(stream_counts(utilities.iter_dataset(args.training_file)))
+        else:
+            model = trainer.build_model(train_set)
+        if args.save_model_file != None:
+            model.save(args.save_model_file, utilities.file_digest(args.training_file), trainer.__name__)
+            print("Saved model to {}".format(args.save_model_file))
+
+    if args.checkpoint:
+        algorithm = checkpoint_viterbi.checkpoint_viterbi
+        name = "{} (checkpoints)".format(args.algorithm)
+    if args.online:
+        algorithm = partial(online_viterbi, max_lag=args.max_lag)
+        name = "{} (online, max lag {})".format(args.algorithm, args.max_lag)
+    if args.tag_dict or args.anchors:
+        # the tag dictionary and the anchors need the tag/word counts of the training file, which the model does not keep
+        if train_corpus != None:
+            counts = HMMCounts.from_corpus(train_corpus)
+        elif args.stream:
+            counts = stream_counts(utilities.iter_dataset(args.training_file))
+        else:
+            counts = HMMCounts.from_sentences(train_set)
+    if args.tag_dict:
+        tag_dict = TagDictionary.from_counts(counts, model, args.tag_dict_min_count, args.tag_dict_rare_count)
+        algorithm = partial(dictionary_viterbi, tag_dict=tag_dict)
+        name = "{} (tag dictionary, {} candidate sets)".format(args.algorithm, len(tag_dict.sets))
+    anchors = None
+    if args.anchors:
+        anchors = Anchors.from_counts(counts, model, args.anchor_dominance, args.anchor_min_count)
+        algorithm = partial(anchor_viterbi, anchors=anchors)
+        name = "{} (anchor segmentation)".format(args.algorithm)
+
+    cache = None
+    if args.cache_entries != None or args.cache_bytes != None:
+        cache = SentenceCache(args.cache_entries, args.cache_bytes)
+
+    if not args.stream:
+        test_words = utilities.strip_tags(test_set)
+        # the taggers decode from this same encoding, the test set is only encoded once
+        encoded = EncodedSentences(model, test_words)
+        print("Unknown words: {}".format(encoded.report()))
+        if anchors != None:
+            print("Anchors: {}".format(anchors.report(encoded)))
 
-    algorithms = {"base_viterbi": base_viterbi, "optimized_viterbi": optimized_viterbi}
-    algorithm = algorithms[args.algorithm]
-    
-    print("Running {}...".format(args.algorithm))
-    testtag_predictions = algorithm(train_set, utilities.strip_tags(test_set))
-    baseline_acc, correct_wordtagcounter, wrong_wordtagcounter = utilities.evaluate_accuracies(testtag_predictions, test_set)
-    multitags_acc, unseen_acc, = utilities.specialword_accuracies(train_set, testtag_predictions, test_set)
+    print("Running {}...".format(name))
+    start = time.perf_counter()
+    if args.stream:
+        # the test file is read twice in step, once for the words to tag and once for the true tags
+        evaluator = utilities.StreamEvaluator(*utilities.get_word_tag_statistics(utilities.iter_dataset(args.training_file)))
+        test_sentences, tag_sentences = tee(utilities.iter_dataset(args.test_file))
+        predictions = stream_tag(algorithm, model, utilities.iter_strip_tags(test_sentences),
+                                 workers=args.workers, batch_size=args.batch_size, cache=cache)
+        tokens = 0
+        for pred_sentence, tag_sentence in zip(predictions, tag_sentences):
+            evaluator.add(pred_sentence, tag_sentence)
+            tokens += len(tag_sentence)
+        seconds = time.perf_counter() - start
+        baseline_acc, correct_wordtagcounter, wrong_wordtagcounter = evaluator.accuracies()
+        multitags_acc, unseen_acc, = evaluator.specialword_accuracies()
+    else:
+        testtag_predictions = algorithm(train_set, test_words, model, args.workers, args.batch_size, cache, encoded=encoded)
+        seconds = time.perf_counter() - start
+        tokens = sum(len(sentence) for sentence in test_set)
+        baseline_acc, correct_wordtagcounter, wrong_wordtagcounter = utilities.evaluate_accuracies(testtag_predictions, test_set)
+        multitags_acc, unseen_acc, = utilities.specialword_accuracies(train_set, testtag_predictions, test_set)
+    print("Tagged {} tokens in {:.2f}s ({:,.0f} tokens/sec)".format(tokens, seconds, tokens / seconds))
+    if cache != None:
+        print("Sentence cache: {}".format(cache.stats()))
+
+    if args.confidence != None:
+        start = time.perf_counter()
+        posteriors = sentence_posteriors(model, test_words, encoded)
+        seconds = time.perf_counter() - start
+        print("Computed the tag posteriors of {} tokens in {:.2f}s ({:,.0f} tokens/sec)".format(tokens, seconds, tokens / seconds))
+        print("Confidence: {}".format(confidence_report(tag_confidences(model, testtag_predictions, posteriors), testtag_predictions, test_set, args.confidence)))
+
+    if args.kbest != None:
+        start = time.perf_counter()
+        kbest = kbest_viterbi(None, test_words, model, args.kbest, encoded)
+        seconds = time.perf_counter() - start
+        print("Decoded the {} best sequences of {} tokens in {:.2f}s ({:,.0f} tokens/sec)".format(args.kbest, tokens, seconds, tokens / seconds))
+        print("\tOracle accuracy (best of the {} sequences): {:.2f}%".format(args.kbest, utilities.evaluate_accuracies(oracle_predictions(kbest, test_set), test_set)[0] * 100))
 
     print("Accuracy: {:.2f}%".format(baseline_acc * 100))
     print("\tMultitags Accuracy: {:.2f}%".format(multitags_acc * 100))
     print("\tUnseen words Accuracy: {:.2f}%".format(unseen_acc * 100))
     print("\tTop 4 Wrong Word-Tag Predictions: {}".format(utilities.topk_wordtagcounter(wrong_wordtagcounter, k=4)))
     print("\tTop 4 Correct Word-Tag Predictions: {}".format(utilities.topk_wordtagcounter(correct_wordtagcounter, k=4)))
-    
+
     print()
 
 
@@ -39,10 +167,59 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='SHPE HMM AI Project')
     parser.add_argument('--train', dest='training_file', type=str, help='the file of the training data')
     parser.add_argument('--test', dest='test_file', type=str, help='the file of the testing data')
-    parser.add_argument('--algorithm', dest='algorithm', type=str, default="baseline", help='which algorithm to run: base_viterbi, optimized_viterbi')
+    parser.add_argument('--algorithm', dest='algorithm', type=str, default="baseline", help='which algorithm to run: base_viterbi, optimized_viterbi, vectorized_viterbi')
+    parser.add_argument('--save-model', dest='save_model_file', type=str, help='train, then save the trained model to this file')
+    parser.add_argument('--model', dest='model_file', type=str, help='load a model saved with --save-model instead of training (it must come from the same training file)')
+    parser.add_argument('--train-workers', dest='train_workers', type=int, default=1, help='count the training file in this many worker processes, one shard each')
+    parser.add_argument('--workers', dest='workers', type=int, default=1, help='tag the test sentences in this many worker processes')
+    parser.add_argument('--batch-size', dest='batch_size', type=int, help='decode batches of this many sentences of similar length at once')
+    parser.add_argument('--beam-width', dest='beam_width', type=int, help='beam search: keep only this many tags per column of the trellis')
+    parser.add_argument('--beam-threshold', dest='beam_threshold', type=float, help='beam search: keep only the tags within this many log units of the best one in each column')
+    parser.add_argument('--checkpoint', dest='checkpoint', action='store_true', help='keep only every sqrt(n)-th column of the trellis and recompute the rest during the traceback, for very long sentences')
+    parser.add_argument('--online', dest='online', action='store_true', help='feed the words to an online tagger one at a time, each tag comes out as soon as it is certain')
+    parser.add_argument('--max-lag', dest='max_lag', type=int, help='with --online, tag a word from the best path so far once this many words are waiting')
+    parser.add_argument('--tag-dict', dest='tag_dict', action='store_true', help='only consider the tags each known word was seen with in training, unknown and rare words keep every tag')
+    parser.add_argument('--tag-dict-min-count', dest='tag_dict_min_count', type=int, default=1, help='with --tag-dict, a tag must have been seen this many times with a word to be a candidate for it')
+    parser.add_argument('--tag-dict-rare-count', dest='tag_dict_rare_count', type=int, default=1, help='with --tag-dict, words seen fewer times than this keep every tag')
+    parser.add_argument('--anchors', dest='anchors', action='store_true', help='give words always seen with one tag that tag, and decode the segments between them separately')
+    parser.add_argument('--anchor-dominance', dest='anchor_dominance', type=float, default=1.0, help='with --anchors, a word is an anchor if at least this share of its training occurrences have one tag')
+    parser.add_argument('--anchor-min-count', dest='anchor_min_count', type=int, default=5, help='with --anchors, words seen fewer times than this are never anchors')
+    parser.add_argument('--confidence', dest='confidence', type=float, help='compute the posterior probability of every predicted tag with forward-backward, and report the tags below this confidence')
+    parser.add_argument('--kbest', dest='kbest', type=int, help='also decode the k best tag sequences of every sentence, and report the accuracy of the best of them')
+    parser.add_argument('--stream', dest='stream', action='store_true', help='read, tag and evaluate the files one chunk of sentences at a time instead of loading them into memory')
+    parser.add_argument('--corpus-cache', dest='corpus_cache', type=str, help='directory to cache the parsed training and test files in, later runs load them from there instead of parsing them')
+    parser.add_argument('--cache-entries', dest='cache_entries', type=int, help='cache the tags of up to this many distinct sentences, repeated sentences are only tagged once')
+    parser.add_argument('--cache-bytes', dest='cache_bytes', type=int, help='like --cache-entries, but limit the cache to about this many bytes')
     args = parser.parse_args()
-    
+
     if args.training_file == None or args.test_file == None:
         sys.exit('You must specify training file and testing file!')
 
+    if args.train_workers < 1 or args.workers < 1:
+        sys.exit('--train-workers and --workers must be at least 1')
+    if args.beam_width != None and args.beam_width < 1:
+        sys.exit('--beam-width must be at least 1')
+    if args.batch_size != None and args.batch_size < 1:
+        sys.exit('--batch-size must be at least 1')
+    if (args.cache_entries != None and args.cache_entries < 0) or (args.cache_bytes != None and args.cache_bytes < 0):
+        sys.exit('--cache-entries and --cache-bytes cannot be negative')
+    if (args.beam_width != None or args.beam_threshold != None) and args.batch_size != None:
+        sys.exit('beam search decodes one sentence at a time, it cannot be used with --batch-size')
+    if args.tag_dict and (args.beam_width != None or args.beam_threshold != None or args.batch_size != None):
+        sys.exit('--tag-dict cannot be used with beam search or --batch-size')
+    if args.max_lag != None and (not args.online or args.max_lag < 1):
+        sys.exit('--max-lag must be at least 1, and is only used with --online')
+    if args.online and (args.checkpoint or args.tag_dict or args.anchors or args.beam_width != None or args.beam_threshold != None or args.batch_size != None):
+        sys.exit('--online cannot be used with --checkpoint, --tag-dict, --anchors, beam search or --batch-size')
+    if args.checkpoint and (args.tag_dict or args.anchors or args.beam_width != None or args.beam_threshold != None or args.batch_size != None):
+        sys.exit('--checkpoint cannot be used with --tag-dict, --anchors, beam search or --batch-size')
+    if args.anchors and (args.tag_dict or args.beam_width != None or args.beam_threshold != None):
+        sys.exit('--anchors cannot be used with --tag-dict or beam search')
+    if args.stream and (args.confidence != None or args.kbest != None):
+        sys.exit('--confidence and --kbest need the whole test set, they cannot be used with --stream')
+    if args.kbest != None and args.kbest < 1:
+        sys.exit('--kbest must be at least 1')
+    if args.stream and args.corpus_cache != None:
+        sys.exit('--stream reads the files as it goes, it cannot be used with --corpus-cache')
+
     main(args)
@@ -0,0 +1,166 @@
+from functools import partial
+
+from base_viterbi import model_lists, viterbi_stepforward
+from decoding import decode
+from optimized_viterbi import build_model
+from utilities import START_TAG, END_TAG
+
+"""
+Online decoding for token streams (e.g. live captions): words are pushed one at a time and their tags come out as soon
+as they are certain, instead of at the end of the sentence. A column's tag is certain once every path still alive in
+the newest column goes through the same tag there, since the best path of the whole sentence is one of those paths.
+"""
+
+
+class OnlineTagger:
+    """
+    Tags one stream of words with the viterbi_stepforward recurrence, keeping only the columns whose tags are not out
+    yet. push() returns the (word, tag) pairs that became certain, finish() ends the sentence and returns the rest.
+    Without max_lag the tags are exactly the ones of offline decoding. With max_lag, at most max_lag words wait for
+    their tag: when more do, the oldest one gets its tag on the best path so far, which may differ from offline decoding.
+    """
+
+    def __init__(self, model, max_lag=None):
+        """
+        :param model: HMMModel to decode against
+        :param max_lag: Most words waiting for their tag (no limit if None)
+        """
+        if max_lag is not None and max_lag < 1:
+            raise ValueError("max_lag must be at least 1, got {}".format(max_lag))
+        self.model = model
+        self.max_lag = max_lag
+        self.log_start, self.log_trans = model_lists(model)
+        self.tokens = 0
+        self.total_delay = 0  # sum over the words of how many words were pushed after them before their tag came out
+        self.max_delay = 0
+        self.forced = 0  # tags given because of max_lag
+        self.start()
+
+    def start(self):
+        """
+        Starts a new sentence, its first column is START
+        """
+        self.column = 0
+        self.log_prob = viterbi_stepforward(0, self.model.log_emission(START_TAG), self.model.log_init.tolist(),
+                                            self.log_start, self.log_trans)[0]
+        self.pending = []  # (word, column) of the words waiting for their tag, oldest first
+        self.backpointers = []  # backpointer row of each pending word's column
+
+    def push(self, word, log_prob_emit=None):
+        """
+        :param word: The next word of the sentence
+        :param log_prob_emit: Log emission vector of the word, e.g. from EncodedSentences.emissions (looked up in the
+        model if None)
+        :return: The (word, tag) pairs, in order, whose tags became certain with this word
+        """
+        if log_prob_emit is None:
+            log_prob_emit = self.model.log_emission(word)
+        self.column += 1
+        self.log_prob, backpointer = viterbi_stepforward(self.column, log_prob_emit, self.log_prob,
+                                                         self.log_start, self.log_trans)
+        self.pending.append((word, self.column))
+        self.backpointers.append(backpointer)
+        return self.converged() + self.force()
+
+    def finish(self, log_prob_emit=None):
+        """
+        Ends the sentence with END and starts a new one
+        :param log_prob_emit: Log emission vector of END (looked up in the model if None)
+        :return: The (word, tag) pairs of the words still waiting, then END's
+        """
+        emitted = self.push(END_TAG, log_prob_emit)
+        emitted += self.emit(len(self.pending), self.log_prob.index(max(self.log_prob)))
+        self.start()
+        return emitted
+
+    def emit(self, count, tag):
+        """
+        Gives the oldest pending words their tags
+        :param count: Number of words, the tag of the count-th one is known
+        :param tag: ID of the tag of the count-th pending word
+        :return: Their (word, tag) pairs
+        """
+        tags = [tag]
+        for k in range(count - 1, 0, -1):
+            tag = self.backpointers[k][tag]
+            tags.append(tag)
+        tags.reverse()
+        emitted = [(word, self.model.tags[t]) for (word, _), t in zip(self.pending, tags)]
+        for _, column in self.pending[:count]:
+            delay = self.column - column
+            self.total_delay += delay
+            self.max_delay = max(self.max_delay, delay)
+        self.tokens += count
+        del self.pending[:count]
+        del self.backpointers[:count]
+        return emitted
+
+    def converged(self):
+        """
+        Follows every live path of the newest column back until they all go through one tag
+        :return: The (word, tag) pairs of the pending words up to that column
+        """
+        # states holds the tags the live paths go through at pending word k - 1
+        states = {tag for tag, log_prob in enumerate(self.log_prob) if log_prob > float('-inf')}
+        for k in range(len(self.pending), 0, -1):
+            if len(states) == 1:
+                return self.emit(k, states.pop())
+            backpointer = self.backpointers[k - 1]
+            states = {backpointer[tag] for tag in states}
+        return []
+
+    def force(self):
+        """
+        :return: The (word, tag) pairs of the oldest pending words past max_lag, tagged from the best path so far
+        """
+        if self.max_lag is None or len(self.pending) <= self.max_lag:
+            return []
+        count = len(self.pending) - self.max_lag
+        tag = self.log_prob.index(max(self.log_prob))
+        for k in range(len(self.pending) - 1, count - 1, -1):
+            tag = self.backpointers[k][tag]
+        self.forced += count
+        return self.emit(count, tag)
+
+    def stats(self):
+        return "{} words, mean delay {:.2f} words, max delay {} words, {} tags forced by the lag limit".format(
+            self.tokens, self.total_delay / max(self.tokens, 1), self.max_delay, self.forced)
+
+
+def online_sentences(model, test, encoded, batch_size=None, max_lag=None):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: not supported, see online_viterbi
+    :param max_lag: Most words waiting for their tag, see OnlineTagger
+    :return: list of sentences, each sentence is a list of (word,tag) pairs
+    """
+    # every sentence is fed to the tagger word by word, as a stream would be, between its START and END
+    online = OnlineTagger(model, max_lag)
+    predicts = []
+    for sen, sentence in enumerate(test):
+        emissions = encoded.emissions(sen)
+        predicted = [(START_TAG, START_TAG)]
+        for word, log_prob_emit in zip(sentence[1:-1], emissions[1:-1]):
+            predicted.extend(online.push(word, log_prob_emit))
+        predicted.extend(online.finish(emissions[-1]))
+        predicts.append(predicted)
+    return predicts
+
+
+def online_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, max_lag=None, encoded=None):
+    '''
+    Tags the test data with OnlineTagger, pushing the words of each sentence one at a time
+    train:  training data (list of sentences, with tags on the words), only used if model is None
+    test, model, workers, cache, encoded: see optimized_viterbi
+    batch_size: not supported, the words are pushed one at a time
+    max_lag: most words waiting for their tag, see OnlineTagger
+    '''
+    if batch_size:
+        raise ValueError("online_viterbi pushes one word at a time, it cannot be used with batch_size")
+    if model is None:
+        model = build_model(train)
+    return decode(partial(online_viterbi, max_lag=max_lag), partial(online_sentences, max_lag=max_lag),
+                  model, test, workers, batch_size, cache, encoded)
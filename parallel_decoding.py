@@ -0,0 +1,114 @@
+import os
+import tempfile
+from multiprocessing import Pool, get_start_method
+
+from hmm_model import MappedHMMModel
+
+"""
+Parallel decoding: the test sentences are cut into chunks of consecutive sentences and each chunk is tagged by a worker
+process. Only the chunk bounds and the predictions travel between processes, the model and the test set are never
+pickled per task.
+"""
+
+# what the workers decode with, set in the parent before forking or by init_worker in each worker
+shared = {}
+
+
+def init_worker(tagger, model_file, test):
+    shared["tagger"] = tagger
+    shared["model"] = MappedHMMModel.open(model_file)
+    shared["test"] = test
+
+
+def decode_chunk(bounds):
+    """
+    :param bounds: (start, end) of the chunk in the test set
+    :return: Predictions for test[start:end]
+    """
+    start, end = bounds
+    return shared["tagger"](None, shared["test"][start:end], shared["model"])
+
+
+def decode_sentences(sentences):
+    """
+    :param sentences: Sentences sent with the task, see DecodePool
+    :return: Their predictions
+    """
+    return shared["tagger"](None, sentences, shared["model"])
+
+
+def parallel_decode(tagger, model, test, workers, chunk_size=64):
+    """
+    :param tagger: base_viterbi, optimized_viterbi or vectorized_viterbi, called on each chunk with the model
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param workers: Number of worker processes
+    :param chunk_size: Number of sentences per task
+    :return: Predictions, in the same order as test
+    """
+    chunks = [(start, min(start + chunk_size, len(test))) for start in range(0, len(test), chunk_size)]
+    if get_start_method() == "fork":
+        # forked workers inherit the model and the test set copy-on-write
+        shared.update(tagger=tagger, model=model, test=test)
+        try:
+            with Pool(workers) as pool:
+                results = pool.map(decode_chunk, chunks)
+        finally:
+            shared.clear()
+    else:
+        # spawned workers start empty, each one memory-maps the same model file so they share one copy of it
+        with tempfile.TemporaryDirectory() as directory:
+            model_file = os.path.join(directory, "decode.model")
+            model.save(model_file)
+            with Pool(workers, init_worker, (tagger, model_file, test)) as pool:
+                results = pool.map(decode_chunk, chunks)
+                pool.close()
+                pool.join()
+    return [predicts for chunk in results for predicts in chunk]
+
+
+class DecodePool:
+    """
+    Worker processes that keep their model across several test sets, e.g. the chunks of a stream: the pool is started,
+    and where processes are spawned the model file written, once instead of for every test set. Unlike parallel_decode,
+    the sentences are not known when the workers start, so each task carries its own sentences.
+    """
+
+    def __init__(self, tagger, model, workers):
+        """
+        :param tagger: base_viterbi, optimized_viterbi or vectorized_viterbi, called on each chunk with the model
+        :param model: HMMModel to decode against
+        :param workers: Number of worker processes
+        """
+        self.directory = None
+        if get_start_method() == "fork":
+            # forked workers inherit the model copy-on-write, shared is cleared again by close
+            shared.update(tagger=tagger, model=model)
+            self.pool = Pool(workers)
+        else:
+            self.directory = tempfile.TemporaryDirectory()
+            model_file = os.path.join(self.directory.name, "decode.model")
+            model.save(model_file)
+            self.pool = Pool(workers, init_worker, (tagger, model_file, None))
+
+    def decode(self, test, chunk_size=64):
+        """
+        :param test: test data (list of sentences, no tags on the words)
+        :param chunk_size: Number of sentences per task
+        :return: Predictions, in the same order as test
+        """
+        chunks = [test[start:start + chunk_size] for start in range(0, len(test), chunk_size)]
+        return [predicts for chunk in self.pool.map(decode_sentences, chunks) for predicts in chunk]
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+        shared.clear()
+        if self.directory is not None:
+            self.directory.cleanup()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,74 @@
+import io
+import os
+from functools import reduce
+from multiprocessing import Pool
+
+from hmm_counts import HMMCounts
+from utilities import parse_line
+
+"""
+Map-reduce training: the training file is cut into shards at line boundaries, each worker process reads, parses and
+counts its own shard, and the shard counts are merged in file order. Smoothed probabilities (and the hapax words, which
+need the counts of the whole corpus) are only derived from the merged counts, with the training_from_counts() of the
+algorithm, so the model is exactly the one serial training builds.
+"""
+
+
+def shard_offsets(data_file, shards):
+    """
+    :param data_file: Training data file
+    :param shards: Number of shards
+    :return: shards + 1 byte offsets, every shard starts at the beginning of a line
+    """
+    size = os.path.getsize(data_file)
+    offsets = [0]
+    with open(data_file, 'rb') as f:
+        for k in range(1, shards):
+            # move on to the start of the line holding the byte before the even split point
+            f.seek(max(size * k // shards - 1, 0))
+            f.readline()
+            offsets.append(max(f.tell(), offsets[-1]))
+    offsets.append(size)
+    return offsets
+
+
+def count_shard(shard):
+    """
+    :param shard: (data file, start offset, end offset)
+    :return: HMMCounts of the sentences in the shard, parsed like load_dataset() does
+    """
+    data_file, start, end = shard
+    with open(data_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    sentences = []
+    # newline=None splits lines the way reading the file in text mode does
+    for line in io.StringIO(data.decode('UTF-8'), newline=None):
+        sentence = parse_line(line)
+        if len(sentence) > 2:
+            sentences.append(sentence)
+    return HMMCounts.from_sentences(sentences)
+
+
+def parallel_counts(data_file, workers, shards=None):
+    """
+    :param data_file: Training data file
+    :param workers: Number of worker processes
+    :param shards: Number of shards, defaults to one per worker
+    :return: HMMCounts of the whole file, identical to HMMCounts.from_sentences(load_dataset(data_file))
+    """
+    offsets = shard_offsets(data_file, shards or workers)
+    with Pool(workers) as pool:
+        counts = pool.map(count_shard, [(data_file, start, end) for start, end in zip(offsets, offsets[1:])])
+    return reduce(HMMCounts.merge, counts)
+
+
+def parallel_build_model(module, data_file, workers, shards=None):
+    """
+    :param module: base_viterbi or optimized_viterbi, the algorithm whose model is trained
+    :param data_file: Training data file
+    :param workers: Number of worker processes
+    :param shards: Number of shards, defaults to one per worker
+    :return: HMMModel, the same one module.build_model(load_dataset(data_file)) returns
+    """
+    return module.build_model_from_counts(parallel_counts(data_file, workers, shards))
@@ -0,0 +1,96 @@
+import sys
+from collections import OrderedDict
+
+
+class SentenceCache:
+    """
+    A bounded LRU cache of tagged sentences, keyed on the tuple of words. Sentences that repeat verbatim are tagged once
+    and then answered from the cache. The cache remembers the model its tags came from and empties itself as soon as it
+    is used with a different one (e.g. a model from IncrementalTrainer.update), so it never returns stale tags.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        """
+        :param max_entries: Most sentences to keep (no limit if None)
+        :param max_bytes: Most bytes to keep, as estimated by entry_size (no limit if None)
+        """
+        if (max_entries is not None and max_entries < 0) or (max_bytes is not None and max_bytes < 0):
+            raise ValueError("max_entries and max_bytes cannot be negative, got {} and {}".format(max_entries, max_bytes))
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # {words: (tags, size)}, least recently used first
+        self.nbytes = 0
+        self.model = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def clear(self):
+        self.entries.clear()
+        self.nbytes = 0
+
+    @staticmethod
+    def entry_size(words, tags):
+        """
+        :return: Estimated bytes used by an entry: the words (which the cache keeps alive) and the two tuples, the tags
+        themselves are shared with the model
+        """
+        return sys.getsizeof(words) + sum(map(sys.getsizeof, words)) + sys.getsizeof(tags)
+
+    def put(self, words, tags):
+        """
+        :param words: Tuple of words
+        :param tags: Tuple of their tags
+        """
+        if words in self.entries:
+            self.nbytes -= self.entries.pop(words)[1]
+        size = self.entry_size(words, tags)
+        self.entries[words] = (tags, size)
+        self.nbytes += size
+        while self.entries and ((self.max_entries is not None and len(self.entries) > self.max_entries) or
+                                (self.max_bytes is not None and self.nbytes > self.max_bytes)):
+            self.nbytes -= self.entries.popitem(last=False)[1][1]
+            self.evictions += 1
+
+    def tag(self, test, model, tagger):
+        """
+        Tags sentences, looking each one up in the cache first
+        :param test: test data (list of sentences, no tags on the words)
+        :param model: HMMModel the sentences are tagged with
+        :param tagger: Tags a list of sentences with the model, called once with the distinct sentences not in the cache
+        :return: list of sentences, each sentence is a list of (word,tag) pairs, in the same order as test
+        """
+        if model is not self.model:
+            self.clear()
+            self.model = model
+
+        predicts = [None] * len(test)
+        missing = {}  # {words: indices in test}, a sentence repeated within test is only tagged once
+        for i, sentence in enumerate(test):
+            words = tuple(sentence)
+            if words in missing:
+                missing[words].append(i)
+                self.hits += 1
+            elif words in self.entries:
+                self.entries.move_to_end(words)
+                predicts[i] = list(zip(sentence, self.entries[words][0]))
+                self.hits += 1
+            else:
+                missing[words] = [i]
+                self.misses += 1
+
+        if not missing:
+            return predicts
+        for words, predicted in zip(missing, tagger([list(words) for words in missing])):
+            tags = tuple(tag for _, tag in predicted)
+            for i in missing[words]:
+                predicts[i] = list(zip(test[i], tags))
+            self.put(words, tags)
+        return predicts
+
+    def stats(self):
+        return "{} hits, {} misses, {} evictions, {} sentences ({:.1f} KiB) cached".format(
+            self.hits, self.misses, self.evictions, len(self.entries), self.nbytes / 1024)
@@ -0,0 +1,65 @@
+from collections import Counter
+
+import numpy as np
+
+from utilities import START_TAG, END_TAG
+
+
+class EncodedSentences:
+    """
+    Test sentences encoded against a model before decoding. Every distinct word is resolved once, to its known word ID
+    or, for an unknown word, to its unknown word class, and gets the emission row of that ID or class (unknown words of
+    the same class share a row). Each sentence becomes an array of row IDs, so decoding looks emissions up by index
+    instead of resolving every occurrence of a word again.
+    """
+
+    def __init__(self, model, test):
+        """
+        :param model: HMMModel the sentences will be decoded against
+        :param test: test data (list of sentences, no tags on the words)
+        """
+        # distinct words, in order of first occurrence, with their number of occurrences
+        self.word_counts = Counter(word for sentence in test for word in sentence)
+        self.unknown_words = set()
+        self.log_emissions = []  # log emission vector of each row
+        self.row_keys = []  # known word ID, or -1 - unknown word class, of each row
+        rows = {}  # {known word ID, or -1 - unknown word class: row ID}
+        word_rows = {}
+        for word in self.word_counts:
+            w = model.vocab.get(word)
+            if w is None:
+                self.unknown_words.add(word)
+                key = -1 - model.unknown_class(word)
+            else:
+                key = w
+            if key not in rows:
+                rows[key] = len(rows)
+                self.row_keys.append(key)
+                self.log_emissions.append(model.log_emission(word))
+            word_rows[word] = rows[key]
+        self.total_tags = len(model.tags)
+        self.sentences = [np.array([word_rows[word] for word in sentence], dtype=np.intp) for sentence in test]
+
+    def emissions(self, s):
+        """
+        :param s: Index of a sentence
+        :return: The log emission vector (list of T log probabilities) of each word of the sentence
+        """
+        return [self.log_emissions[r] for r in self.sentences[s].tolist()]
+
+    def emission_matrix(self):
+        """
+        :return: The log emission vectors as a (rows x T) array, indexed by the row IDs of self.sentences
+        """
+        return np.array(self.log_emissions, dtype=np.float64).reshape(len(self.log_emissions), self.total_tags)
+
+    def report(self):
+        """
+        :return: How many of the word types and tokens (not counting START and END) are unknown to the model
+        """
+        words = [word for word in self.word_counts if word not in (START_TAG, END_TAG)]
+        tokens = sum(self.word_counts[word] for word in words)
+        unknown_tokens = sum(self.word_counts[word] for word in self.unknown_words)
+        return "{} of {} word types ({:.2f}%), {} of {} tokens ({:.2f}%) unknown, {} emission rows".format(
+            len(self.unknown_words), len(words), 100 * len(self.unknown_words) / max(len(words), 1),
+            unknown_tokens, tokens, 100 * unknown_tokens / max(tokens, 1), len(self.log_emissions))
@@ -0,0 +1,102 @@
+from functools import partial
+from itertools import islice
+
+import numpy as np
+
+from hmm_counts import HMMCounts, count_tokens, sum_keys
+from parallel_decoding import DecodePool
+
+"""
+Streaming mode: sentences are read, counted and tagged one chunk at a time (see utilities.iter_dataset), so the memory
+used depends on the model and the chunk size, not on the size of the corpus.
+"""
+
+CHUNK_SIZE = 1000
+
+
+def chunks(sentences, chunk_size=CHUNK_SIZE):
+    """
+    :param sentences: Iterable of sentences
+    :param chunk_size: Number of sentences per chunk
+    :return: Generator of lists of up to chunk_size consecutive sentences
+    """
+    sentences = iter(sentences)
+    chunk = list(islice(sentences, chunk_size))
+    while chunk:
+        yield chunk
+        chunk = list(islice(sentences, chunk_size))
+
+
+def stream_counts(sentences, chunk_size=CHUNK_SIZE):
+    """
+    :param sentences: Iterable of training sentences, with tags on the words
+    :param chunk_size: Number of sentences counted at once
+    :return: HMMCounts of all of the sentences, identical to HMMCounts.from_sentences(list(sentences))
+    """
+    # the tag and word IDs are kept across chunks, so a chunk's counts need no remapping
+    tag_ids = {}
+    word_ids = {}
+    tag_count = np.zeros(0, dtype=np.int64)
+    pair_count = np.zeros((0, 0), dtype=np.int64)
+    emit_keys = np.zeros(0, dtype=np.int64)
+    emit_counts = np.zeros(0, dtype=np.int64)
+    # tag/word counts of the chunks since emit_keys was last rebuilt, summed into it once they outnumber its keys, so
+    # every key is sorted a logarithmic number of times instead of once per chunk
+    pending_keys, pending_counts, pending = [], [], 0
+    num_sentences = 0
+
+    for chunk in chunks(sentences, chunk_size):
+        tag_seq = np.array([tag_ids.setdefault(tag, len(tag_ids)) for sentence in chunk for _, tag in sentence], dtype=np.int64)
+        word_seq = np.array([word_ids.setdefault(word, len(word_ids)) for sentence in chunk for word, _ in sentence], dtype=np.int64)
+        offsets = np.cumsum([0] + [len(sentence) for sentence in chunk], dtype=np.int64)
+        total_tags = len(tag_ids)
+        if total_tags > len(tag_count):
+            # new tags get zero counts so far
+            tag_count = np.pad(tag_count, (0, total_tags - len(tag_count)))
+            pair_count = np.pad(pair_count, (0, total_tags - len(pair_count)))
+
+        chunk_tag_count, chunk_pair_count, keys, counts = count_tokens(tag_seq, word_seq, offsets, total_tags)
+        tag_count += chunk_tag_count
+        pair_count += chunk_pair_count
+        num_sentences += len(chunk)
+        pending_keys.append(keys)
+        pending_counts.append(counts)
+        pending += len(keys)
+        if pending > len(emit_keys):
+            emit_keys, emit_counts = sum_keys([emit_keys] + pending_keys, [emit_counts] + pending_counts)
+            pending_keys, pending_counts, pending = [], [], 0
+
+    if pending:
+        emit_keys, emit_counts = sum_keys([emit_keys] + pending_keys, [emit_counts] + pending_counts)
+    return HMMCounts(list(tag_ids), list(word_ids), tag_count, pair_count, emit_keys, emit_counts, num_sentences)
+
+
+def stream_tag(tagger, model, sentences, chunk_size=CHUNK_SIZE, workers=1, cache=None, **options):
+    """
+    :param tagger: base_viterbi, optimized_viterbi, vectorized_viterbi or beam_viterbi, called on each chunk with the model
+    :param model: HMMModel to decode against
+    :param sentences: Iterable of test sentences, no tags on the words
+    :param chunk_size: Number of sentences tagged at once
+    :param workers: Number of worker processes, started once for the whole stream
+    :param cache: Optional SentenceCache, kept across the chunks
+    :param options: Passed on to the tagger (batch_size)
+    :return: Generator of predicted sentences, each a list of (word,tag) pairs, in the order of sentences
+    """
+    tagger = partial(tagger, **options)
+    if workers > 1:
+        with DecodePool(tagger, model, workers) as pool:
+            yield from tag_chunks(pool.decode, model, sentences, chunk_size, cache)
+    else:
+        yield from tag_chunks(lambda chunk: tagger(None, chunk, model), model, sentences, chunk_size, cache)
+
+
+def tag_chunks(decode, model, sentences, chunk_size, cache):
+    """
+    :param decode: Tags a list of sentences with the model
+    :return: Generator of predicted sentences, see stream_tag
+    """
+    for chunk in chunks(sentences, chunk_size):
+        if cache is not None:
+            yield from cache.tag(chunk, model, decode)
+        else:
+            yield from decode(chunk)
@@ -0,0 +1,159 @@
+from functools import partial
+
+import numpy as np
+
+from hmm_counts import HMMCounts
+from decoding import decode
+from optimized_viterbi import build_model
+
+"""
+Tag dictionary decoding: a known word is only given the tags it was seen with in training, instead of every tag with
+the smoothed probabilities of the tags it was never seen with. A column of the trellis then costs (k_prev x k_cur)
+instead of (T x T). Unknown words, and optionally rare words, keep the full tag set.
+"""
+
+MIN_TAG_COUNT = 1
+RARE_WORD_COUNT = 1
+
+
+class TagDictionary:
+    """
+    The candidate tags of each known word. Words share their candidate sets (most words have the same one or two
+    tags), so every distinct set is stored once, as a sorted array of tag IDs, and each word keeps the index of its set.
+    Set 0 is the full tag set, used for unknown and rare words.
+    """
+
+    def __init__(self, total_tags, sets, word_sets):
+        """
+        :param total_tags: Number of tags of the model
+        :param sets: List of candidate sets (sorted tag ID arrays), sets[0] is every tag
+        :param word_sets: {known word ID: index in sets}, words not in it use the full tag set
+        """
+        self.total_tags = total_tags
+        self.sets = sets
+        self.word_sets = word_sets
+        self.positions = [np.arange(len(tags)) for tags in sets]
+
+    @classmethod
+    def from_counts(cls, counts, model, min_count=MIN_TAG_COUNT, rare_count=RARE_WORD_COUNT):
+        """
+        :param counts: HMMCounts of the training data the model was trained on
+        :param model: HMMModel the dictionary is used with, gives the word and tag IDs
+        :param min_count: Only tags seen at least this many times with a word are candidates for it
+        :param rare_count: Words seen fewer times than this keep the full tag set
+        :return: TagDictionary
+        """
+        tag_ids = np.array([model.tag_ids[tag] for tag in counts.tags], dtype=np.intp)
+        word_ids = np.array([-1 if w is None else w for w in map(model.vocab.get, counts.words)], dtype=np.intp)
+        key_tags = (counts.emit_keys >> 32).astype(np.intp)
+        key_words = (counts.emit_keys & 0xFFFFFFFF).astype(np.intp)
+        word_total = np.bincount(key_words, weights=counts.emit_counts, minlength=len(counts.words))
+
+        keep = (counts.emit_counts >= min_count) & (word_total[key_words] >= rare_count) & (word_ids[key_words] >= 0)
+        candidates = {}
+        for w, t in zip(word_ids[key_words[keep]].tolist(), tag_ids[key_tags[keep]].tolist()):
+            candidates.setdefault(w, []).append(t)
+
+        total_tags = len(model.tags)
+        set_ids = {tuple(range(total_tags)): 0}
+        word_sets = {w: set_ids.setdefault(tuple(sorted(tags)), len(set_ids)) for w, tags in candidates.items()}
+        sets = [np.array(tags, dtype=np.intp) for tags in set_ids]
+        return cls(total_tags, sets, word_sets)
+
+    def candidate_set(self, key):
+        """
+        :param key: Known word ID, or a negative unknown word class key (see EncodedSentences.row_keys)
+        :return: Index in self.sets of the word's candidate tags
+        """
+        return self.word_sets.get(key, 0) if key >= 0 else 0
+
+    def column_work(self, encoded):
+        """
+        :param encoded: EncodedSentences of the test data
+        :return: Sum of k_prev x k_cur over the columns of the sentences, as a fraction of the T x T the full lattice adds
+        """
+        sizes = np.array([len(self.sets[self.candidate_set(key)]) for key in encoded.row_keys], dtype=np.int64)
+        pairs = sum(int((sizes[rows[:-1]] * sizes[rows[1:]]).sum()) for rows in encoded.sentences)
+        columns = sum(max(len(rows) - 1, 0) for rows in encoded.sentences)
+        return pairs / max(columns * self.total_tags ** 2, 1)
+
+
+def dictionary_decode(log_start, log_trans, emit_vectors, column_sets, tag_dict, trans_blocks):
+    """
+    Runs the viterbi lattice over one sentence, each column only over its candidate tags
+    :param log_start: START transition log vector (T)
+    :param log_trans: Transition log matrix (T x T), rows are the previous tag
+    :param emit_vectors: Log emission vector of each column, only over its candidate tags
+    :param column_sets: Index in tag_dict.sets of the candidate tags of each column
+    :param tag_dict: TagDictionary
+    :param trans_blocks: {(previous set, set): block of log_trans}, filled in as pairs of sets are met
+    :return: Tag IDs of the best path for columns 1..n-1, the first column is always START
+    """
+    length = len(emit_vectors)
+    backpointers = [None] * length
+    prev = column_sets[0]
+    log_prob = emit_vectors[0] + log_start[tag_dict.sets[prev]]
+    for i in range(1, length):
+        cur = column_sets[i]
+        block = trans_blocks.get((prev, cur))
+        if block is None:
+            block = trans_blocks[prev, cur] = log_trans[tag_dict.sets[prev][:, None], tag_dict.sets[cur]]
+        # same summation order as viterbi_stepforward: (prev + emit) + trans
+        scores = (log_prob[:, None] + emit_vectors[i]) + block
+        backpointers[i] = scores.argmax(axis=0)
+        log_prob = scores[backpointers[i], tag_dict.positions[cur]]
+        prev = cur
+
+    # backpointers are positions in the candidates of the previous column
+    best = int(log_prob.argmax())
+    path = [int(tag_dict.sets[column_sets[length - 1]][best])]
+    for i in range(length - 1, 1, -1):
+        best = int(backpointers[i][best])
+        path.append(int(tag_dict.sets[column_sets[i - 1]][best]))
+    path.reverse()
+    return path
+
+
+def dictionary_sentences(model, test, encoded, batch_size=None, tag_dict=None):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: not supported, see dictionary_viterbi
+    :param tag_dict: TagDictionary of the model
+    :return: list of sentences, each sentence is a list of (word,tag) pairs
+    """
+    # each emission row is cut down to its candidates once
+    emit_matrix = encoded.emission_matrix()
+    row_sets = [tag_dict.candidate_set(key) for key in encoded.row_keys]
+    row_emissions = [emit_matrix[r, tag_dict.sets[c]] for r, c in enumerate(row_sets)]
+    trans_blocks = {}
+    predicts = []
+
+    for sentence, rows in zip(test, encoded.sentences):
+        rows = rows.tolist()
+        path = dictionary_decode(model.log_start, model.log_trans, [row_emissions[r] for r in rows],
+                                 [row_sets[r] for r in rows], tag_dict, trans_blocks)
+        best_tag_seq = ["START"] + [model.tags[t] for t in path]
+        predicts.append([(word, tag) for word, tag in zip(sentence, best_tag_seq)])
+
+    return predicts
+
+
+def dictionary_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, tag_dict=None, encoded=None):
+    '''
+    Tags the test data with each known word's candidate tags only
+    train:  training data (list of sentences, with tags on the words), used if model or tag_dict is None
+    test, model, workers, cache, encoded: see optimized_viterbi
+    batch_size: not supported, the columns of different sentences have different candidate tags
+    tag_dict: TagDictionary of the model, built from the training data with the default thresholds if not given
+    '''
+    if batch_size:
+        raise ValueError("dictionary_viterbi decodes one sentence at a time, it cannot be used with batch_size")
+    if model is None:
+        model = build_model(train)
+    if tag_dict is None:
+        tag_dict = TagDictionary.from_counts(HMMCounts.from_sentences(train), model)
+    return decode(partial(dictionary_viterbi, tag_dict=tag_dict), partial(dictionary_sentences, tag_dict=tag_dict),
+                  model, test, workers, batch_size, cache, encoded)
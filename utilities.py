@@ -1,4 +1,7 @@
 import collections
+import contextlib
+import gc
+import hashlib
 
 START_TAG = "START"
 END_TAG = "END"
@@ -76,39 +79,148 @@ def specialword_accuracies(train_sentences, predicted_sentences, tag_sentences):
     return multitag_accuracy, unseen_accuracy
 
 
+class StreamEvaluator:
+    """
+    Computes what evaluate_accuracies and specialword_accuracies return, but one predicted sentence at a time, so
+    neither the predictions nor the tagged test sentences have to be kept in memory
+    """
+
+    def __init__(self, seen_words, words_with_multitags_set):
+        """
+        :param seen_words, words_with_multitags_set: What get_word_tag_statistics returns for the training sentences
+        """
+        self.seen_words = seen_words
+        self.words_with_multitags_set = words_with_multitags_set
+        self.correct_wordtagcounter = {}
+        self.wrong_wordtagcounter = {}
+        self.correct = 0
+        self.wrong = 0
+        self.multitags_correct = 0
+        self.multitags_wrong = 0
+        self.unseen_correct = 0
+        self.unseen_wrong = 0
+
+    def add(self, pred_sentence, tag_sentence):
+        """
+        :param pred_sentence: Predicted (word, tag) pairs of one sentence
+        :param tag_sentence: True (word, tag) pairs of the sentence
+        """
+        assert len(pred_sentence) == len(tag_sentence), "The predicted sentence length {} does not match the true length {}".format(len(pred_sentence), len(tag_sentence))
+        for pred_wordtag, real_wordtag in zip(pred_sentence, tag_sentence):
+            assert pred_wordtag[0] == real_wordtag[0], "The predicted sentence WORDS do not match with the original sentence, you should only be predicting the tags"
+            word, tag = real_wordtag
+            if tag in [START_TAG, END_TAG]:
+                continue
+            if pred_wordtag[1] == tag:
+                self.correct_wordtagcounter.setdefault(word, collections.Counter())[tag] += 1
+                self.correct += 1
+                self.multitags_correct += word in self.words_with_multitags_set
+                self.unseen_correct += word not in self.seen_words
+            else:
+                self.wrong_wordtagcounter.setdefault(word, collections.Counter())[tag] += 1
+                self.wrong += 1
+                self.multitags_wrong += word in self.words_with_multitags_set
+                self.unseen_wrong += word not in self.seen_words
+
+    def accuracies(self):
+        """
+        :return: Same as evaluate_accuracies
+        """
+        return self.correct / (self.correct + self.wrong), self.correct_wordtagcounter, self.wrong_wordtagcounter
+
+    def specialword_accuracies(self):
+        """
+        :return: Same as specialword_accuracies
+        """
+        multitag_accuracy = self.multitags_correct / (self.multitags_correct + self.multitags_wrong)
+        total_unseen = self.unseen_correct + self.unseen_wrong
+        unseen_accuracy = self.unseen_correct / total_unseen if total_unseen > 0 else 0
+        return multitag_accuracy, unseen_accuracy
+
+
 def topk_wordtagcounter(wordtagcounter, k):
     top_items = sorted(wordtagcounter.items(), key=lambda item: sum(item[1].values()), reverse=True)[:k]
     top_items = list(map(lambda item: (item[0], dict(item[1])), top_items))
     return top_items
 
 
+def backtrace(backpointers, best_tag, tags, length):
+    """
+    Follows a viterbi backpointer table back from the best final tag
+    :param backpointers: Flat array with one row of len(tags) previous tag indices per lattice column after the first
+    :param best_tag: Index of the best tag in the last column
+    :param tags: List of tags, in the order used by the backpointers
+    :param length: Number of columns in the lattice
+    :return: The predicted tag sequence, the first column is always START
+    """
+    total_tags = len(tags)
+    tag_seq = [START_TAG] * length
+    for i in range(length - 1, 0, -1):
+        tag_seq[i] = tags[best_tag]
+        best_tag = backpointers[(i - 1) * total_tags + best_tag]
+    return tag_seq
+
+
+def file_digest(data_file):
+    """
+    :param data_file:
+    :return: sha256 hex digest of the file contents
+    """
+    digest = hashlib.sha256()
+    with open(data_file, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
 def load_dataset(data_file):
+    with paused_gc():
+        return list(iter_dataset(data_file))
+
+
+@contextlib.contextmanager
+def paused_gc():
+    """
+    Pauses the cyclic garbage collector while a corpus is built. A corpus is millions of new tuples and none of them
+    are garbage, but every few thousand allocations the collector would scan them all again.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def iter_dataset(data_file):
+    """
+    Reads a data file like load_dataset, one sentence at a time
+    :param data_file:
+    :return: Generator of sentences, each a list of (word, tag) pairs
+    """
     if not data_file.endswith(".txt"):
         raise ValueError("File must be a .txt file")
 
-    sentences = []
     with open(data_file, 'r', encoding='UTF-8') as f:
-        for line in f:
-            sentence = [(START_TAG, START_TAG)]
-            raw = line.split()
-            for pair in raw:
-                splitted = pair.split('=')
-                if (len(splitted) < 2):
-                    continue
+        # read about a megabyte of lines at a time
+        for lines in iter(lambda: f.readlines(1 << 20), []):
+            for line in lines:
+                sentence = parse_line(line)
+                if len(sentence) > 2:
+                    yield sentence
                 else:
-                    tag = splitted[-1]
-
-                    # find word
-                    word = splitted[0]
-                    for element in splitted[1:-1]:
-                        word += '/' + element
-                    sentence.append((word.lower(), tag))
-            sentence.append((END_TAG, END_TAG))
-            if len(sentence) > 2:
-                sentences.append(sentence)
-            else:
-                print(sentence)
-    return sentences
+                    print(sentence)
+
+
+def parse_line(line):
+    """
+    :param line: One line of a data file, word=TAG pairs separated by whitespace
+    :return: The sentence as a list of (word, tag) pairs, between (START, START) and (END, END)
+    """
+    # the tag follows the last '=', any other '=' in the pair is part of the word and becomes '/'
+    pairs = [pair.rpartition('=') for pair in line.split()]
+    return [(START_TAG, START_TAG)] + [(word.replace('=', '/').lower(), tag) for word, sep, tag in pairs if sep] + [(END_TAG, END_TAG)]
 
 
 def strip_tags(sentences):
@@ -132,6 +244,16 @@ def strip_tags(sentences):
     return sentences_without_tags
 
 
+def iter_strip_tags(sentences):
+    """
+    Strips the tags like strip_tags, one sentence at a time
+    :param sentences: Iterable of sentences, each a list of (word,tag) pairs
+    :return: Generator of sentences, each a list of words without tags
+    """
+    for sentence in sentences:
+        yield [word for word, _ in sentence]
+
+
 def get_word_tag_statistics(data_set):
     # get set of all seen words and set of words with multitags
     word_tags = collections.defaultdict(lambda: set())
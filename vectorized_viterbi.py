@@ -0,0 +1,64 @@
+import numpy as np
+
+from batch_viterbi import batch_decode
+from decoding import decode
+from optimized_viterbi import build_model
+
+
+def viterbi_decode(log_start, log_trans, emit_vectors):
+    """
+    Runs the viterbi lattice over one sentence, one broadcast add and argmax per column
+    :param log_start: START transition log vector (T)
+    :param log_trans: Transition log matrix (T x T), rows are the previous tag
+    :param emit_vectors: Log emission vector (T) for each column of the lattice, e.g. an (n x T) array
+    :return: Tag IDs of the best path for columns 1..n-1, the first column is always START
+    """
+    length = len(emit_vectors)
+    backpointers = np.empty((length, len(log_start)), dtype=np.intp)
+    columns = np.arange(len(log_start))
+    log_prob = emit_vectors[0] + log_start
+    for i in range(1, length):
+        # same summation order as viterbi_stepforward: (prev + emit) + trans
+        scores = (log_prob[:, None] + emit_vectors[i]) + log_trans
+        backpointers[i] = scores.argmax(axis=0)
+        log_prob = scores[backpointers[i], columns]
+
+    best = int(log_prob.argmax())
+    path = [best]
+    for i in range(length - 1, 1, -1):
+        best = int(backpointers[i][best])
+        path.append(best)
+    path.reverse()
+    return path
+
+
+def vectorized_sentences(model, test, encoded, batch_size=None):
+    """
+    Decodes test sentences in this process, see decoding.decode
+    :param model: HMMModel to decode against
+    :param test: test data (list of sentences, no tags on the words)
+    :param encoded: EncodedSentences of the test data against the model
+    :param batch_size: if given, decode batches of this many sentences of similar length at once (see batch_viterbi)
+    :return: list of sentences, each sentence is a list of (word,tag) pairs
+    """
+    if batch_size:
+        return batch_decode(model, test, batch_size, encoded)
+    emit_matrix = encoded.emission_matrix()
+    predicts = []
+
+    for sentence, rows in zip(test, encoded.sentences):
+        emit_vectors = emit_matrix[rows]
+        best_tag_seq = ["START"] + [model.tags[t] for t in viterbi_decode(model.log_start, model.log_trans, emit_vectors)]
+        predicts.append([(word, tag) for word, tag in zip(sentence, best_tag_seq)])
+
+    return predicts
+
+def vectorized_viterbi(train, test, model=None, workers=1, batch_size=None, cache=None, encoded=None):
+    '''
+    Same predictions as optimized_viterbi, each column of the lattice is computed with numpy
+    train:  training data (list of sentences, with tags on the words), only used if model is None
+    test, model, workers, batch_size, cache, encoded: see optimized_viterbi
+    '''
+    if model is None:
+        model = build_model(train)
+    return decode(vectorized_viterbi, vectorized_sentences, model, test, workers, batch_size, cache, encoded)